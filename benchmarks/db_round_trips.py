@@ -0,0 +1,174 @@
+"""
+Считает обращения к БД на обновление: чтение состояния FSM, которое aiogram выполняет для каждого обновления, и
+запись истории. Сравниваются регистрация кодека JSONB при каждом получении соединения и при его создании, а также
+чтение состояния в транзакции, одним запросом и через кэш. Обращения считает поддельное соединение, поэтому ни БД, ни настройки бота
+не нужны:
+
+    python -m benchmarks.db_round_trips --updates 1000 --pool-size 10 --users 100
+"""
+
+import argparse
+import asyncio
+from collections.abc import AsyncGenerator, Awaitable, Callable
+from contextlib import asynccontextmanager
+from itertools import cycle
+from typing import Any
+
+from aiogram.fsm.storage.base import StorageKey
+
+from src.model.caches import MemoryCache
+from src.model.db import AsyncpgManager
+from src.model.repositories import AsyncpgRepository
+from src.model.storages import DBStorage
+
+
+class CountingConnection:
+    """
+    Каждый вызов соответствует одному обращению к серверу: регистрация кодека запрашивает каталог типов, а
+    транзакция добавляет BEGIN и COMMIT.
+    """
+
+    def __init__(self, counter: list[int]) -> None:
+        self._counter = counter
+
+    async def set_type_codec(self, *args: Any, **kwargs: Any) -> None:
+        self._counter[0] += 1
+
+    async def execute(self, *args: Any) -> str:
+        self._counter[0] += 1
+
+        return "INSERT 0 1"
+
+    async def fetchrow(self, *args: Any) -> None:
+        self._counter[0] += 1
+
+    @asynccontextmanager
+    async def transaction(self, **kwargs: Any) -> AsyncGenerator[None, None]:
+        self._counter[0] += 1
+        yield
+        self._counter[0] += 1
+
+
+class CountingPool:
+    def __init__(
+        self,
+        size: int,
+        counter: list[int],
+        init: Callable[[CountingConnection], Awaitable[None]] | None = None,
+    ) -> None:
+        self._connections = [CountingConnection(counter) for _ in range(size)]
+        self._turn = cycle(self._connections)
+        self._init = init
+        self._initialized: set[int] = set()
+
+    @asynccontextmanager
+    async def acquire(self) -> AsyncGenerator[CountingConnection, None]:
+        conn = next(self._turn)
+
+        if self._init is not None and id(conn) not in self._initialized:
+            self._initialized.add(id(conn))
+            await self._init(conn)
+
+        yield conn
+
+
+class PerAcquireManager(AsyncpgManager):
+    """
+    Прежнее поведение: кодек регистрировался при каждом получении соединения из пула.
+    """
+
+    async def _create_pool(self, settings: dict[str, Any]) -> Any:
+        return await self.pool_factory(**settings)
+
+    @asynccontextmanager
+    async def begin(self, read_only: bool = False) -> AsyncGenerator[Any, None]:
+        async with self.pool.acquire() as conn:
+            await self._init_connection(conn)
+
+            async with conn.transaction(readonly=read_only):
+                yield conn
+
+
+class TransactionalStorage(DBStorage):
+    """
+    Прежнее поведение: состояние читалось в отдельной транзакции.
+    """
+
+    async def _load(self, key: str) -> tuple[str | None, dict[str, Any]]:
+        async with self.db_manager.begin() as conn:
+            return await self.repository.get_state(key, self.ttl, conn) or (None, {})
+
+
+SCENARIOS = (
+    (
+        "codec per acquire, state in transaction",
+        PerAcquireManager,
+        TransactionalStorage,
+        False,
+    ),
+    (
+        "codec per connection, state in transaction",
+        AsyncpgManager,
+        TransactionalStorage,
+        False,
+    ),
+    ("codec per connection, state fetched", AsyncpgManager, DBStorage, False),
+    ("codec per connection, state cached", AsyncpgManager, DBStorage, True),
+)
+
+
+async def measure(
+    manager_class: type[AsyncpgManager],
+    storage_class: type[DBStorage],
+    cached: bool,
+    updates: int,
+    pool_size: int,
+    users: int,
+) -> int:
+    counter = [0]
+
+    async def pool_factory(**kwargs: Any) -> CountingPool:
+        return CountingPool(pool_size, counter, kwargs.get("init"))
+
+    manager = manager_class({}, pool_factory=pool_factory)
+    manager.pool = await manager._create_pool(manager.settings)
+    storage = storage_class(
+        AsyncpgRepository(), manager, cache=MemoryCache(users) if cached else None
+    )
+
+    for update in range(updates):
+        user_id = update % users
+        await storage.get_state(StorageKey(bot_id=1, chat_id=user_id, user_id=user_id))
+
+        async with manager.begin() as conn:
+            await conn.execute(
+                "INSERT INTO history (user_id, observation_id) VALUES ($1, $2)"
+            )
+
+    return counter[0]
+
+
+async def main() -> None:
+    parser = argparse.ArgumentParser(description=__doc__)
+    parser.add_argument("--updates", type=int, default=1000)
+    parser.add_argument("--pool-size", type=int, default=10)
+    parser.add_argument("--users", type=int, default=100)
+    args = parser.parse_args()
+
+    for name, manager_class, storage_class, cached in SCENARIOS:
+        round_trips = await measure(
+            manager_class,
+            storage_class,
+            cached,
+            args.updates,
+            args.pool_size,
+            args.users,
+        )
+        print(
+            f"{name:<45}{round_trips:>8} round trips"
+            f"{round_trips / args.updates:>8.2f} per update"
+        )
+
+
+if __name__ == "__main__":
+    asyncio.run(main())
@@ -8,8 +8,76 @@ import logging
 from aiogram import Bot
 
 from src.model.db import db_manager
-from src.presenter.core import dispatcher
-from src.settings import bot_settings
+from src.model.http import http_manager
+from src.model.limiters import TokenBucket
+from src.model.schedulers import scheduler
+from src.model.writers import history_writer
+from src.presenter.broadcasts import Broadcaster
+from src.presenter.core import (
+    dispatcher,
+    quotas,
+    refresher,
+    service,
+    storage,
+    subscription_runner,
+    view,
+    weather_client,
+)
+from src.presenter.webhooks import WebhookServer
+from src.settings import (
+    LOGGER,
+    bot_settings,
+    breaker_settings,
+    fsm_settings,
+    quota_settings,
+    refresh_settings,
+    retention_settings,
+    subscription_settings,
+    webhook_settings,
+)
+
+
+async def maintain_history() -> None:
+    await db_manager.create_partitions(retention_settings.partitions_ahead)
+
+    if retention_settings.keep_months is not None:
+        await db_manager.expire_partitions(
+            retention_settings.keep_months,
+            retention_settings.policy,
+            retention_settings.archive_dir,
+        )
+
+
+async def sync_quotas() -> None:
+    for quota in quotas.values():
+        await quota.sync()
+
+
+async def report_weather_services() -> None:
+    for service_, breaker in weather_client.breakers.items():
+        LOGGER.info(
+            "%s circuit: %s.",
+            service_,
+            ", ".join(f"{name}={value}" for name, value in breaker.items()),
+        )
+
+    LOGGER.info(
+        "Weather cache: %s.",
+        ", ".join(
+            f"{name}={value}" for name, value in weather_client.cache_stats.items()
+        ),
+    )
+
+
+scheduler.every(retention_settings.interval, maintain_history)
+scheduler.every(fsm_settings.cleanup_interval, storage.expire)
+scheduler.every(quota_settings.sync_interval, sync_quotas)
+
+if breaker_settings.report_interval is not None:
+    scheduler.every(breaker_settings.report_interval, report_weather_services)
+
+if refresh_settings.enabled:
+    scheduler.every(refresh_settings.interval, refresher.refresh)
 
 
 async def main() -> None:
@@ -17,11 +85,50 @@ async def main() -> None:
         level=logging.DEBUG, format="%(asctime)s — %(levelname)s: %(message)s"
     )
     bot = Bot(bot_settings.token.get_secret_value())
+    broadcaster = Broadcaster(
+        bot,
+        view,
+        TokenBucket(subscription_settings.rate, subscription_settings.rate),
+        service.unsubscribe,
+        subscription_settings.senders,
+    )
 
-    async with db_manager:
-        await dispatcher.start_polling(
-            bot, **bot_settings.model_dump(exclude={"token"})
-        )
+    async def send_subscriptions() -> None:
+        await subscription_runner.run(broadcaster.send_weather)
+
+    scheduler.every(subscription_settings.interval, send_subscriptions)
+
+    async with db_manager, http_manager, history_writer, subscription_runner, scheduler:
+        try:
+            if bot_settings.webhook:
+                await WebhookServer(
+                    dispatcher,
+                    bot,
+                    **webhook_settings.model_dump(exclude={"secret_token"}),
+                    health=lambda: {
+                        "breakers": weather_client.breakers,
+                        "cache": weather_client.cache_stats,
+                    },
+                    secret_token=(
+                        None
+                        if webhook_settings.secret_token is None
+                        else webhook_settings.secret_token.get_secret_value()
+                    ),
+                    **bot_settings.model_dump(
+                        include={
+                            "allowed_updates",
+                            "handle_signals",
+                            "close_bot_session",
+                        }
+                    ),
+                ).serve()
+            else:
+                await dispatcher.start_polling(
+                    bot, **bot_settings.model_dump(exclude={"token", "webhook"})
+                )
+        finally:
+            # Расход квот, накопленный с последнего сведения, иначе был бы потерян.
+            await sync_quotas()
 
 
 if __name__ == "__main__":
@@ -0,0 +1,127 @@
+from collections import deque
+from enum import StrEnum
+from statistics import quantiles
+from time import monotonic
+from typing import Any
+
+from src.settings import LOGGER
+
+
+class BreakerState(StrEnum):
+    CLOSED = "closed"
+    OPEN = "open"
+    HALF_OPEN = "half-open"
+
+
+class CircuitBreaker:
+    """
+    Следит за долей ошибок и задержками последних вызовов службы. При превышении допустимой доли ошибок размыкается и
+    какое-то время отклоняет вызовы сразу, затем пропускает один пробный: его успех замыкает цепь, неудача — снова
+    размыкает. Тайм-аут подстраивается под наблюдаемые задержки.
+    """
+
+    def __init__(
+        self,
+        name: str,
+        window: int = 50,
+        min_calls: int = 10,
+        failure_rate: float = 0.5,
+        open_duration: float = 30.0,
+        timeout_percentile: int = 95,
+        timeout_factor: float = 2.0,
+        min_timeout: float = 1.0,
+        max_timeout: float = 10.0,
+    ) -> None:
+        self.name: str = name
+        self.min_calls: int = min_calls
+        self.failure_rate: float = failure_rate
+        self.open_duration: float = open_duration
+        self.timeout_percentile: int = timeout_percentile
+        self.timeout_factor: float = timeout_factor
+        self.min_timeout: float = min_timeout
+        self.max_timeout: float = max_timeout
+
+        self.state: BreakerState = BreakerState.CLOSED
+
+        self._calls: deque[tuple[bool, float]] = deque(maxlen=window)
+        self._opened_at: float = 0.0
+        self._probing: bool = False
+
+    def _switch(self, state: BreakerState) -> None:
+        if state is self.state:
+            return
+
+        LOGGER.warning("%s circuit is %s.", self.name, state)
+        self.state = state
+
+        if state is BreakerState.OPEN:
+            self._opened_at = monotonic()
+        elif state is BreakerState.CLOSED:
+            self._calls.clear()
+
+    @property
+    def observed_failure_rate(self) -> float:
+        if not self._calls:
+            return 0.0
+
+        return sum(not success for success, _ in self._calls) / len(self._calls)
+
+    @property
+    def timeout(self) -> float:
+        latencies = [latency for success, latency in self._calls if success]
+
+        # Для оценки перцентиля нужно хотя бы две точки.
+        if len(latencies) < max(self.min_calls, 2):
+            return self.max_timeout
+
+        percentile = quantiles(latencies, n=100)[self.timeout_percentile - 1]
+
+        return min(
+            max(percentile * self.timeout_factor, self.min_timeout), self.max_timeout
+        )
+
+    def allow(self) -> bool:
+        if (
+            self.state is BreakerState.OPEN
+            and monotonic() - self._opened_at >= self.open_duration
+        ):
+            self._switch(BreakerState.HALF_OPEN)
+
+        if self.state is BreakerState.OPEN:
+            return False
+
+        if self.state is BreakerState.HALF_OPEN:
+            if self._probing:
+                return False
+
+            self._probing = True
+
+        return True
+
+    def record(self, success: bool, latency: float) -> None:
+        if self.state is BreakerState.HALF_OPEN:
+            self._probing = False
+            self._switch(BreakerState.CLOSED if success else BreakerState.OPEN)
+
+        self._calls.append((success, latency))
+
+        if (
+            self.state is BreakerState.CLOSED
+            and len(self._calls) >= self.min_calls
+            and self.observed_failure_rate >= self.failure_rate
+        ):
+            self._switch(BreakerState.OPEN)
+
+    def abandon(self) -> None:
+        """
+        Вызов был отменён до получения результата: он не должен влиять на статистику, но и блокировать пробу тоже.
+        """
+        self._probing = False
+
+    def to_dict(self) -> dict[str, Any]:
+        return {
+            "state": str(self.state),
+            "calls": len(self._calls),
+            "failure_rate": round(self.observed_failure_rate, 3),
+            "timeout": round(self.timeout, 3),
+        }
@@ -0,0 +1,101 @@
+import json
+from abc import ABC, abstractmethod
+from collections import OrderedDict
+from time import monotonic
+from typing import Any
+
+from src.model.db import DBManager
+from src.model.repositories import Repository
+
+
+class Cache(ABC):
+    @abstractmethod
+    async def get(self, key: str, max_age: float | None = None) -> Any | None:
+        pass
+
+    @abstractmethod
+    async def set(self, key: str, value: Any, age: float = 0.0) -> None:
+        """
+        age — сколько значение уже хранилось до записи: перенесённое из другого кэша не должно становиться свежее.
+        """
+        pass
+
+
+class MemoryCache(Cache):
+    """
+    LRU-кэш в памяти процесса с ограниченным сроком свежести записей. При чтении срок свежести можно переопределить,
+    поэтому записи не удаляются по его истечении, а вытесняются как давно не использованные.
+    """
+
+    def __init__(self, max_size: int, ttl: float | None = None) -> None:
+        self.max_size: int = max_size
+        self.ttl: float | None = ttl
+
+        self._entries: OrderedDict[str, tuple[float, Any]] = OrderedDict()
+
+    async def get(self, key: str, max_age: float | None = None) -> Any | None:
+        try:
+            stored_at, value = self._entries[key]
+        except KeyError:
+            return None
+
+        max_age = self.ttl if max_age is None else max_age
+
+        if max_age is not None and monotonic() - stored_at >= max_age:
+            return None
+
+        self._entries.move_to_end(key)
+
+        return value
+
+    async def set(self, key: str, value: Any, age: float = 0.0) -> None:
+        self._entries[key] = (monotonic() - age, value)
+        self._entries.move_to_end(key)
+
+        while len(self._entries) > self.max_size:
+            self._entries.popitem(last=False)
+
+
+class GeocodingCache(Cache):
+    """
+    Кэш результатов геокодирования в БД с фронтальным кэшем в памяти: они почти не меняются и должны переживать
+    перезапуск.
+    """
+
+    def __init__(
+        self,
+        front: Cache,
+        repository: Repository,
+        db_manager: DBManager,
+        ttl: float | None = None,
+    ) -> None:
+        self.front: Cache = front
+        self.repository: Repository = repository
+        self.db_manager: DBManager = db_manager
+        self.ttl: float | None = ttl
+
+    async def get(self, key: str, max_age: float | None = None) -> Any | None:
+        value = await self.front.get(key, max_age)
+
+        if value is not None:
+            return value
+
+        async with self.db_manager.begin(read_only=True) as conn:
+            row = await self.repository.get_geocoding(
+                key, self.ttl if max_age is None else max_age, conn
+            )
+
+        if row is None:
+            return None
+
+        serialized, age = row
+        value = json.loads(serialized)
+        await self.front.set(key, value, age)
+
+        return value
+
+    async def set(self, key: str, value: Any, age: float = 0.0) -> None:
+        await self.front.set(key, value, age)
+
+        async with self.db_manager.begin() as conn:
+            await self.repository.create_geocoding(key, json.dumps(value), age, conn)
@@ -0,0 +1,66 @@
+import asyncio
+from collections.abc import Awaitable, Callable, Hashable
+from typing import Any, Generic, TypeVar
+
+
+ResultT = TypeVar("ResultT")
+
+
+class SingleFlight(Generic[ResultT]):
+    """
+    Объединяет одновременные вызовы с одинаковым ключом в один: все ожидающие получают общий результат или общую
+    ошибку. Отмена одного из ожидающих не прерывает общий вызов — он завершится для остальных.
+    """
+
+    def __init__(self) -> None:
+        self._flights: dict[Hashable, asyncio.Future[ResultT]] = {}
+
+    def _land(self, key: Hashable, flight: asyncio.Future[ResultT]) -> None:
+        if self._flights.get(key) is flight:
+            del self._flights[key]
+
+        # Исключение извлекается, даже если все ожидающие были отменены, чтобы не засорять журнал.
+        if not flight.cancelled():
+            flight.exception()
+
+    def start(
+        self, key: Hashable, func: Callable[[], Awaitable[ResultT]]
+    ) -> asyncio.Future[ResultT]:
+        """
+        Запускает вызов, если он ещё не идёт, не дожидаясь результата.
+        """
+        flight = self._flights.get(key)
+
+        if flight is None:
+            flight = asyncio.ensure_future(func())
+            self._flights[key] = flight
+            flight.add_done_callback(lambda done: self._land(key, done))
+
+        return flight
+
+    async def do(
+        self, key: Hashable, func: Callable[[], Awaitable[ResultT]]
+    ) -> ResultT:
+        return await asyncio.shield(self.start(key, func))
+
+    def __len__(self) -> int:
+        return len(self._flights)
+
+    def __contains__(self, key: Any) -> bool:
+        return key in self._flights
+
+
+class Progress(Generic[ResultT]):
+    """
+    Последний промежуточный результат общего вызова и сигнал о появлении следующего: так к вызову могут
+    присоединиться не только ждущие итога, но и те, кто показывает его по частям.
+    """
+
+    def __init__(self) -> None:
+        self.latest: ResultT | None = None
+        self.changed: asyncio.Future[None] = asyncio.get_running_loop().create_future()
+
+    def publish(self, result: ResultT) -> None:
+        self.latest = result
+        self.changed.set_result(None)
+        self.changed = asyncio.get_running_loop().create_future()
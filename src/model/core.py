@@ -1,42 +1,138 @@
-from typing import Any
+from collections.abc import AsyncIterator
 
+from src.model.db import DBManager
 from src.model.repositories import Repository
 from src.model.weather_clients import AggregatedWeatherClient
+from src.model.writers import HistoryWriter
+from src.presenter.errors import SubscriptionLimitError
 from src.presenter.schemas import (
+    PydanticHistoryCursor,
+    PydanticHistoryPage,
     PydanticHistoryRecord,
-    PydanticHistoryRecordShort,
     PydanticLocality,
+    PydanticLocalityShort,
+    PydanticObservation,
+    PydanticPosition,
+    PydanticSubscription,
     PydanticUser,
-    PydanticWeather,
 )
 
 
 class Service:
+    """
+    Соединение с БД берётся из пула только на время выполнения запросов к ней, а не на всё время обработки
+    обновления: иначе медленные метеослужбы удерживали бы соединения и блокировали остальные команды.
+    """
+
     def __init__(
-        self, repository: Repository, weather_client: AggregatedWeatherClient
+        self,
+        repository: Repository,
+        weather_client: AggregatedWeatherClient,
+        db_manager: DBManager,
+        history_writer: HistoryWriter,
+        max_subscriptions: int = 5,
     ) -> None:
         self._repository = repository
         self._weather_client = weather_client
+        self._db_manager = db_manager
+        self._history_writer = history_writer
+        self._max_subscriptions = max_subscriptions
+
+    async def register(self, user: PydanticUser) -> None:
+        async with self._db_manager.begin() as conn:
+            await self._repository.create_user(user, conn)
+
+    async def subscribe(
+        self, subscription: PydanticSubscription, verify: bool = True
+    ) -> None:
+        """
+        Каждая подписка — ежедневный запрос к метеослужбам, поэтому их число у пользователя ограничено, а населённый
+        пункт, неизвестный справочнику (verify), проверяется одним запросом: подписка на несуществующий порождала бы
+        безуспешные запросы каждый день. Полученное наблюдение остаётся в кэше.
+        """
+        async with self._db_manager.begin(read_only=True) as conn:
+            localities = await self._repository.get_subscribed_localities(
+                subscription.user_id, conn
+            )
+
+        if (
+            subscription.locality not in localities
+            and len(localities) >= self._max_subscriptions
+        ):
+            raise SubscriptionLimitError
 
-    async def register(self, user: PydanticUser, conn: Any) -> None:
-        await self._repository.create_user(user, conn)
+        if verify:
+            await self._weather_client.get(
+                PydanticLocalityShort(name=subscription.locality)
+            )
+
+        async with self._db_manager.begin() as conn:
+            if not await self._repository.create_subscription(
+                subscription, self._max_subscriptions, conn
+            ):
+                raise SubscriptionLimitError
+
+    async def unsubscribe(self, user_id: int, locality: str | None = None) -> int:
+        async with self._db_manager.begin() as conn:
+            return await self._repository.delete_subscriptions(user_id, locality, conn)
+
+    async def _record(
+        self,
+        locality: PydanticLocality | PydanticPosition,
+        observation: PydanticObservation,
+    ) -> None:
+        await self._history_writer.put(
+            PydanticHistoryRecord(user_id=locality.user_id, observation=observation)
+        )
 
     async def get_weather(
-        self, locality: PydanticLocality, conn: Any
-    ) -> list[PydanticWeather]:
-        comparison = await self._weather_client.get(locality)
-        await self._repository.create_record(
-            PydanticHistoryRecord(
-                user_id=locality.user_id,
-                locality=locality.name,
-                weather=[weather.to_dict(exclude_none=True) for weather in comparison],
-            ),
-            conn,
+        self, locality: PydanticLocality | PydanticPosition
+    ) -> PydanticObservation:
+        observation = await self._weather_client.get(locality)
+        await self._record(locality, observation)
+
+        return observation
+
+    async def stream_weather(
+        self, locality: PydanticLocality | PydanticPosition
+    ) -> AsyncIterator[PydanticObservation]:
+        observation = None
+
+        async for observation in self._weather_client.stream(locality):
+            yield observation
+
+        await self._record(locality, observation)
+
+    @staticmethod
+    def _point(
+        cursor: PydanticHistoryCursor, record: PydanticHistoryRecord, backward: bool
+    ) -> PydanticHistoryCursor:
+        return PydanticHistoryCursor(
+            user_id=cursor.user_id,
+            timestamp=record.timestamp,
+            id=record.id,
+            backward=backward,
+            size=cursor.size,
         )
 
-        return comparison
+    async def get_history(self, cursor: PydanticHistoryCursor) -> PydanticHistoryPage:
+        async with self._db_manager.begin(read_only=True) as conn:
+            records = await self._repository.get_records(cursor, conn)
 
-    async def get_history(
-        self, history: PydanticHistoryRecordShort, conn: Any
-    ) -> list[PydanticHistoryRecord]:
-        return await self._repository.get_all_records(history, conn)
+        more = len(records) > cursor.size
+        records = records[: cursor.size]
+
+        if cursor.backward:
+            records.reverse()
+
+        if not records:
+            return PydanticHistoryPage(records=records)
+
+        has_previous = more if cursor.backward else cursor.timestamp is not None
+        has_next = cursor.backward or more
+
+        return PydanticHistoryPage(
+            records=records,
+            previous=self._point(cursor, records[0], True) if has_previous else None,
+            next=self._point(cursor, records[-1], False) if has_next else None,
+        )
@@ -1,24 +1,79 @@
+import asyncio
+import gzip
+import json
 from abc import ABC, abstractmethod
-from collections.abc import AsyncGenerator
+from collections.abc import AsyncGenerator, Awaitable, Callable
 from contextlib import asynccontextmanager
+from datetime import date, datetime, time
+from pathlib import Path
+from time import monotonic
 from types import TracebackType
-from typing import Any
+from typing import Any, Literal
 
-from asyncpg import Connection, Pool, create_pool
+from asyncpg import Connection, InterfaceError, Pool, PostgresError, create_pool
 
-from src.settings import db_settings
+from src.settings import LOGGER, db_settings
+
+
+RetentionPolicy = Literal["detach", "drop", "archive"]
+
+LEGACY_WEATHER_FIELDS = {
+    "service": "text",
+    "summary": "text",
+    "real_temperature": "real",
+    "feels_like_temperature": "real",
+    "atmospheric_pressure": "real",
+    "wind_speed": "real",
+    "cloudiness": "real",
+    "humidity": "real",
+    "unavailable_services": "text",
+}
+
+REPLICA_SETTINGS = {
+    "replica_dsns",
+    "replica_min_size",
+    "replica_max_size",
+    "replica_retry_interval",
+    "replica_timeout",
+}
+
+SCHEMA_LOCK = 7_301_842
+
+CONNECTION_ERRORS = (OSError, InterfaceError)
+REPLICA_ERRORS = (*CONNECTION_ERRORS, TimeoutError, PostgresError)
+
+
+def _add_months(month: date, months: int) -> date:
+    index = month.year * 12 + month.month - 1 + months
+
+    return date(index // 12, index % 12 + 1, 1)
 
 
 class DBManager(ABC):
     @asynccontextmanager
     @abstractmethod
-    async def begin(self) -> AsyncGenerator[Connection, None]:
+    async def begin(self, read_only: bool = False) -> AsyncGenerator[Connection, None]:
+        pass
+
+    @asynccontextmanager
+    @abstractmethod
+    async def acquire(self) -> AsyncGenerator[Connection, None]:
         pass
 
     @abstractmethod
     async def drop_tables(self) -> None:
         pass
 
+    @abstractmethod
+    async def create_partitions(self, ahead: int) -> None:
+        pass
+
+    @abstractmethod
+    async def expire_partitions(
+        self, keep: int, policy: RetentionPolicy, archive_dir: Path
+    ) -> None:
+        pass
+
     @abstractmethod
     async def __aenter__(self) -> None:
         pass
@@ -33,22 +88,250 @@ class DBManager(ABC):
         pass
 
 
-class AsyncpgManager(DBManager):
+class Replica:
     def __init__(self, settings: dict[str, Any]) -> None:
         self.settings: dict[str, Any] = settings
         self.pool: Pool | None = None
+        self.unavailable_until: float = 0.0
+        self.lock: asyncio.Lock = asyncio.Lock()
+
+    @property
+    def is_available(self) -> bool:
+        return monotonic() >= self.unavailable_until
+
+
+class AsyncpgManager(DBManager):
+    """
+    Запись и чтение, требующее актуальных данных, идут через основной пул, остальное чтение может быть распределено
+    между репликами. Недоступная реплика на время исключается, а чтение переходит на основной пул. Соединение с
+    репликой ожидается не дольше replica_timeout, чтобы недоступная реплика не задерживала чтение.
+    """
+
+    def __init__(
+        self,
+        settings: dict[str, Any],
+        replicas: list[dict[str, Any]] | None = None,
+        retry_interval: float = 30.0,
+        replica_timeout: float = 2.0,
+        pool_factory: Callable[..., Awaitable[Pool]] = create_pool,
+        json_encoder: Callable[[Any], str] = json.dumps,
+        json_decoder: Callable[[str], Any] = json.loads,
+    ) -> None:
+        self.settings: dict[str, Any] = settings
+        self.replicas: list[Replica] = [Replica(replica) for replica in replicas or ()]
+        self.retry_interval: float = retry_interval
+        self.replica_timeout: float = replica_timeout
+        self.pool_factory: Callable[..., Awaitable[Pool]] = pool_factory
+        self.json_encoder: Callable[[Any], str] = json_encoder
+        self.json_decoder: Callable[[str], Any] = json_decoder
+        self.pool: Pool | None = None
+
+        self._turn: int = 0
+
+    async def _init_connection(self, conn: Connection) -> None:
+        """
+        Регистрация кодека требует обращения к каталогу типов, поэтому выполняется один раз на соединение пула.
+        """
+        await conn.set_type_codec(
+            "jsonb",
+            encoder=self.json_encoder,
+            decoder=self.json_decoder,
+            schema="pg_catalog",
+        )
+
+    async def _create_pool(self, settings: dict[str, Any]) -> Pool:
+        return await self.pool_factory(**settings, init=self._init_connection)
+
+    def _disable(self, replica: Replica, exc: BaseException) -> None:
+        LOGGER.warning("Replica is unavailable: %r.", exc)
+        replica.unavailable_until = monotonic() + self.retry_interval
+
+    async def _get_replica_pool(self, replica: Replica) -> Pool | None:
+        """
+        Пул реплики создаётся при первом обращении. Одновременные первые обращения дожидаются одного пула, а не
+        создают каждое свой.
+        """
+        if replica.pool is not None:
+            return replica.pool
+
+        async with replica.lock:
+            if replica.pool is None and replica.is_available:
+                replica.pool = await self._create_pool(
+                    {"timeout": self.replica_timeout, **replica.settings}
+                )
+
+        return replica.pool
+
+    async def _acquire_replica(self) -> tuple[Replica, Connection] | None:
+        """
+        Реплики перебираются по кругу, начиная со следующей после использованной в прошлый раз.
+        """
+        self._turn += 1
+
+        for offset in range(len(self.replicas)):
+            replica = self.replicas[(self._turn + offset) % len(self.replicas)]
+
+            if not replica.is_available:
+                continue
+
+            try:
+                pool = await self._get_replica_pool(replica)
+
+                if pool is not None:
+                    return replica, await pool.acquire(timeout=self.replica_timeout)
+            except REPLICA_ERRORS as exc:
+                self._disable(replica, exc)
+
+        return None
+
+    @asynccontextmanager
+    async def _begin_replica(
+        self, replica: Replica, conn: Connection
+    ) -> AsyncGenerator[Connection, None]:
+        try:
+            async with conn.transaction(readonly=True):
+                yield conn
+        except CONNECTION_ERRORS as exc:
+            self._disable(replica, exc)
+            raise
+        finally:
+            await replica.pool.release(conn)
 
     @asynccontextmanager
-    async def begin(self) -> AsyncGenerator[Connection, None]:
+    async def begin(self, read_only: bool = False) -> AsyncGenerator[Connection, None]:
+        acquired = await self._acquire_replica() if read_only else None
+
+        if acquired is not None:
+            async with self._begin_replica(*acquired) as conn:
+                yield conn
+            return
+
         try:
             async with self.pool.acquire() as conn:
-                async with conn.transaction():
+                async with conn.transaction(readonly=read_only):
                     yield conn
         except AttributeError:
             raise ValueError("Pool is not initialized.")
 
+    @staticmethod
+    async def _detach_legacy_history(conn: Connection) -> bool:
+        """
+        До секционирования история хранилась в обычной таблице. Она переименовывается, чтобы на её месте была создана
+        секционированная, а её индексы удаляются, освобождая имена.
+        """
+        if not await conn.fetchval(
+            """
+            SELECT to_regclass('history') IS NOT NULL AND NOT EXISTS (
+                SELECT 1 FROM pg_partitioned_table WHERE partrelid = to_regclass('history')
+            )
+            """
+        ):
+            return False
+
+        await conn.execute("ALTER TABLE history RENAME TO history_legacy")
+        await conn.execute("ALTER TABLE history_legacy DROP CONSTRAINT history_pkey")
+        await conn.execute(
+            "ALTER TABLE history_legacy DROP CONSTRAINT IF EXISTS history_observation_id_fkey"
+        )
+        await conn.execute("DROP INDEX IF EXISTS history_user_id_timestamp_idx")
+
+        return True
+
+    @staticmethod
+    async def _migrate_observations(conn: Connection) -> None:
+        """
+        До появления наблюдений каждая запись истории хранила сравнение в JSONB. Записи об одном населённом пункте с
+        одинаковым временем становятся одним наблюдением, идентификатор которого берётся у первой из них.
+        """
+        await conn.execute("ALTER TABLE history_legacy ADD COLUMN observation_id UUID")
+        await conn.execute(
+            "UPDATE history_legacy SET timestamp = NOW() WHERE timestamp IS NULL"
+        )
+
+        await conn.execute(
+            """
+            INSERT INTO observations (id, locality, timestamp)
+            SELECT DISTINCT ON (locality, timestamp) id, locality, timestamp
+            FROM history_legacy
+            ORDER BY locality, timestamp, id
+            """
+        )
+        await conn.execute(
+            """
+            UPDATE history_legacy AS h SET observation_id = o.id
+            FROM observations AS o
+            WHERE o.locality = h.locality AND o.timestamp = h.timestamp
+            """
+        )
+
+        await conn.execute(
+            f"""
+            INSERT INTO measurements (observation_id, position, {", ".join(LEGACY_WEATHER_FIELDS)})
+            SELECT
+                h.id, m.position - 1,
+                {", ".join(f"(m.value ->> '{field}')::{type_}" for field, type_ in LEGACY_WEATHER_FIELDS.items())}
+            FROM history_legacy AS h
+            CROSS JOIN jsonb_array_elements(h.weather) WITH ORDINALITY AS m (value, position)
+            WHERE h.id = h.observation_id
+            """
+        )
+
+    async def _migrate_history(self, conn: Connection) -> None:
+        """
+        Записи прежней таблицы переносятся в секционированную, секции для них создаются заранее.
+        """
+        if await conn.fetchval(
+            """
+            SELECT EXISTS (
+                SELECT 1 FROM pg_attribute
+                WHERE attrelid = 'history_legacy'::regclass
+                AND attname = 'weather' AND NOT attisdropped
+            )
+            """
+        ):
+            await self._migrate_observations(conn)
+
+        first, last = await conn.fetchrow(
+            """
+            SELECT LEAST(MIN(timestamp), NOW()::timestamp)::date,
+            GREATEST(MAX(timestamp), NOW()::timestamp)::date
+            FROM history_legacy
+            """
+        )
+        month = first.replace(day=1)
+
+        while month <= last:
+            await self._create_partition(conn, month)
+            month = _add_months(month, 1)
+
+        status = await conn.execute(
+            """
+            INSERT INTO history (id, user_id, observation_id, timestamp)
+            SELECT id, user_id, observation_id, COALESCE(timestamp, NOW())
+            FROM history_legacy
+            """
+        )
+        await conn.execute("DROP TABLE history_legacy")
+
+        LOGGER.info("History migrated to partitions: %s records.", status.split()[-1])
+
+    @asynccontextmanager
+    async def acquire(self) -> AsyncGenerator[Connection, None]:
+        """
+        Соединение основного пула без транзакции: одиночному запросу на чтение не нужны BEGIN и COMMIT.
+        """
+        if self.pool is None:
+            raise ValueError("Pool is not initialized.")
+
+        async with self.pool.acquire() as conn:
+            yield conn
+
     async def _create_tables(self) -> None:
         async with self.begin() as conn:
+            # Экземпляры бота, запущенные одновременно, не должны изменять схему наперегонки.
+            await conn.execute("SELECT pg_advisory_xact_lock($1)", SCHEMA_LOCK)
+            legacy = await self._detach_legacy_history(conn)
+
             await conn.execute(
                 """
                 CREATE TABLE IF NOT EXISTS users (
@@ -58,25 +341,232 @@ class AsyncpgManager(DBManager):
                 """
             )
 
+            await conn.execute(
+                """
+                CREATE TABLE IF NOT EXISTS observations (
+                id UUID PRIMARY KEY,
+                locality TEXT NOT NULL,
+                timestamp TIMESTAMP NOT NULL,
+                UNIQUE (locality, timestamp)
+                )
+                """
+            )
+
+            await conn.execute(
+                """
+                CREATE TABLE IF NOT EXISTS measurements (
+                observation_id UUID REFERENCES observations (id) ON DELETE CASCADE,
+                position SMALLINT,
+                service TEXT NOT NULL,
+                summary TEXT,
+                real_temperature REAL NOT NULL,
+                feels_like_temperature REAL NOT NULL,
+                atmospheric_pressure REAL NOT NULL,
+                wind_speed REAL NOT NULL,
+                cloudiness REAL NOT NULL,
+                humidity REAL NOT NULL,
+                unavailable_services TEXT,
+                PRIMARY KEY (observation_id, position)
+                )
+                """
+            )
+
+            # Секция по умолчанию не создаётся: она не позволила бы просматривать секции по порядку и останавливаться
+            # на последних, когда страницы истории хватает.
             await conn.execute(
                 """
                 CREATE TABLE IF NOT EXISTS history (
-                id UUID PRIMARY KEY DEFAULT gen_random_uuid(),
+                id UUID DEFAULT gen_random_uuid(),
                 user_id BIGINT NOT NULL,
-                locality TEXT NOT NULL,
-                weather JSONB,
+                observation_id UUID NOT NULL REFERENCES observations (id),
+                timestamp TIMESTAMP NOT NULL DEFAULT NOW(),
+                PRIMARY KEY (id, timestamp)
+                ) PARTITION BY RANGE (timestamp)
+                """
+            )
+
+            await conn.execute(
+                """
+                CREATE INDEX IF NOT EXISTS history_user_id_timestamp_idx
+                ON history (user_id, timestamp DESC, id DESC)
+                """
+            )
+
+            # Без индекса удаление наблюдений проверяло бы ссылки на них полным просмотром всех секций истории.
+            await conn.execute(
+                """
+                CREATE INDEX IF NOT EXISTS history_observation_id_idx
+                ON history (observation_id)
+                """
+            )
+
+            await conn.execute(
+                """
+                CREATE TABLE IF NOT EXISTS geocoding (
+                key TEXT PRIMARY KEY,
+                value TEXT NOT NULL,
                 timestamp TIMESTAMP DEFAULT NOW()
                 )
                 """
             )
 
+            await conn.execute(
+                """
+                CREATE TABLE IF NOT EXISTS fsm (
+                key TEXT PRIMARY KEY,
+                state TEXT,
+                data JSONB NOT NULL DEFAULT '{}',
+                timestamp TIMESTAMP NOT NULL DEFAULT NOW()
+                )
+                """
+            )
+
+            await conn.execute(
+                """
+                CREATE TABLE IF NOT EXISTS quotas (
+                service TEXT,
+                day DATE,
+                used INTEGER NOT NULL DEFAULT 0,
+                PRIMARY KEY (service, day)
+                )
+                """
+            )
+
+            await conn.execute(
+                """
+                CREATE TABLE IF NOT EXISTS subscriptions (
+                user_id BIGINT,
+                locality TEXT,
+                time TIME NOT NULL,
+                PRIMARY KEY (user_id, locality)
+                )
+                """
+            )
+
+            await conn.execute(
+                "CREATE INDEX IF NOT EXISTS subscriptions_time_idx ON subscriptions (time)"
+            )
+
+            await conn.execute(
+                "CREATE TABLE IF NOT EXISTS subscription_runs (minute TIMESTAMP PRIMARY KEY)"
+            )
+
+            if legacy:
+                await self._migrate_history(conn)
+
+        await self.create_partitions(1)
+
+    @staticmethod
+    def _name_partition(month: date) -> str:
+        return f"history_{month:%Y_%m}"
+
+    async def _create_partition(self, conn: Connection, month: date) -> None:
+        await conn.execute(
+            f"""
+            CREATE TABLE IF NOT EXISTS {self._name_partition(month)}
+            PARTITION OF history
+            FOR VALUES FROM ('{month}') TO ('{_add_months(month, 1)}')
+            """
+        )
+
+    async def create_partitions(self, ahead: int) -> None:
+        """
+        История секционирована по месяцам. Секции создаются заранее: запись вне существующих секций невозможна.
+        """
+        month = date.today().replace(day=1)
+
+        async with self.begin() as conn:
+            for offset in range(ahead + 1):
+                await self._create_partition(conn, _add_months(month, offset))
+
+    async def _archive_partition(
+        self, conn: Connection, partition: str, archive_dir: Path
+    ) -> None:
+        archive_dir.mkdir(parents=True, exist_ok=True)
+
+        with gzip.open(archive_dir / f"{partition}.csv.gz", "wb") as archive:
+            await conn.copy_from_query(
+                f"""
+                SELECT
+                    h.id, h.user_id, h.timestamp,
+                    o.locality, o.timestamp AS observed_at,
+                    m.position, m.service, m.summary, m.real_temperature,
+                    m.feels_like_temperature, m.atmospheric_pressure, m.wind_speed,
+                    m.cloudiness, m.humidity, m.unavailable_services
+                FROM {partition} AS h
+                JOIN observations AS o ON o.id = h.observation_id
+                JOIN measurements AS m ON m.observation_id = o.id
+                """,
+                output=archive,
+                format="csv",
+                header=True,
+            )
+
+    async def expire_partitions(
+        self, keep: int, policy: RetentionPolicy, archive_dir: Path
+    ) -> None:
+        """
+        Секции старше keep месяцев отсоединяются, удаляются или архивируются в сжатый CSV и удаляются. Вместе с
+        удалёнными секциями удаляются наблюдения, на которые больше не ссылается история.
+        """
+        boundary = _add_months(date.today().replace(day=1), -keep)
+
+        async with self.begin() as conn:
+            partitions = await conn.fetch(
+                """
+                SELECT c.relname FROM pg_inherits AS i
+                JOIN pg_class AS c ON c.oid = i.inhrelid
+                WHERE i.inhparent = 'history'::regclass
+                ORDER BY c.relname
+                """
+            )
+            expired = [
+                row["relname"]
+                for row in partitions
+                if row["relname"] < self._name_partition(boundary)
+            ]
+
+            for partition in expired:
+                if policy == "archive":
+                    await self._archive_partition(conn, partition, archive_dir)
+
+                if policy == "detach":
+                    await conn.execute(
+                        f"ALTER TABLE history DETACH PARTITION {partition}"
+                    )
+                else:
+                    await conn.execute(f"DROP TABLE {partition}")
+
+                LOGGER.info("History partition %s expired (%s).", partition, policy)
+
+            # Отсоединённые секции по-прежнему ссылаются на наблюдения.
+            if expired and policy != "detach":
+                await conn.execute(
+                    """
+                    DELETE FROM observations AS o
+                    WHERE o.timestamp < $1
+                    AND NOT EXISTS (SELECT 1 FROM history AS h WHERE h.observation_id = o.id)
+                    """,
+                    datetime.combine(boundary, time()),
+                )
+
     async def drop_tables(self) -> None:
         async with self.begin() as conn:
-            for table in ("users", "history"):
+            for table in (
+                "users",
+                "history",
+                "measurements",
+                "observations",
+                "geocoding",
+                "fsm",
+                "quotas",
+                "subscriptions",
+                "subscription_runs",
+            ):
                 await conn.execute(f"DROP TABLE IF EXISTS {table}")
 
     async def __aenter__(self) -> None:
-        self.pool = await create_pool(**self.settings)
+        self.pool = await self._create_pool(self.settings)
         await self._create_tables()
 
     async def __aexit__(
@@ -85,7 +575,25 @@ class AsyncpgManager(DBManager):
         exc_val: BaseException | None,
         exc_tb: TracebackType | None,
     ) -> None:
+        for replica in self.replicas:
+            if replica.pool is not None:
+                await replica.pool.close()
+                replica.pool = None
+
         await self.pool.close()
 
 
-db_manager: AsyncpgManager = AsyncpgManager(db_settings.model_dump())
+db_manager: AsyncpgManager = AsyncpgManager(
+    db_settings.model_dump(exclude=REPLICA_SETTINGS),
+    [
+        {
+            **db_settings.model_dump(exclude=REPLICA_SETTINGS),
+            "dsn": dsn,
+            "min_size": db_settings.replica_min_size,
+            "max_size": db_settings.replica_max_size,
+        }
+        for dsn in db_settings.replica_dsns
+    ],
+    db_settings.replica_retry_interval,
+    db_settings.replica_timeout,
+)
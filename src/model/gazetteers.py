@@ -0,0 +1,110 @@
+from bisect import bisect_left
+from pathlib import Path
+from typing import Self
+
+from src.presenter.schemas import normalize_name
+
+
+def _key(name: str) -> str:
+    """
+    Дефис и пробел взаимозаменяемы: «Ростов на Дону» — это «Ростов-на-Дону».
+    """
+    return normalize_name(name.replace("-", " "))
+
+
+def _distance(first: str, second: str, limit: int) -> int:
+    """
+    Расстояние Левенштейна, если оно не больше limit, иначе limit + 1: строки заведомо дальше не досчитываются.
+    """
+    if abs(len(first) - len(second)) > limit:
+        return limit + 1
+
+    previous = list(range(len(second) + 1))
+
+    for i, first_char in enumerate(first, 1):
+        current = [i]
+
+        for j, second_char in enumerate(second, 1):
+            current.append(
+                min(
+                    previous[j] + 1,
+                    current[j - 1] + 1,
+                    previous[j - 1] + (first_char != second_char),
+                )
+            )
+
+        if min(current) > limit:
+            return limit + 1
+
+        previous = current
+
+    return min(previous[-1], limit + 1)
+
+
+class Gazetteer:
+    """
+    Справочник населённых пунктов в виде отсортированного массива ключей: поиск по префиксу сводится к двоичному
+    поиску границ диапазона. Номер населённого пункта — его позиция в массиве, поэтому он не меняется, пока не
+    меняется файл справочника.
+    """
+
+    def __init__(self, names: list[str], max_candidates: int = 1000) -> None:
+        self.max_candidates: int = max_candidates
+
+        entries = dict(sorted((_key(name), name) for name in reversed(names)))
+        self._keys: list[str] = list(entries)
+        self._names: list[str] = list(entries.values())
+
+    @classmethod
+    def from_file(cls, path: Path, max_candidates: int = 1000) -> Self:
+        """
+        Файл содержит по одному названию в строке.
+        """
+        with path.open(encoding="utf-8") as file:
+            return cls([line.strip() for line in file if line.strip()], max_candidates)
+
+    def __len__(self) -> int:
+        return len(self._names)
+
+    def __getitem__(self, index: int) -> str:
+        return self._names[index]
+
+    def _range(self, prefix: str) -> range:
+        return range(
+            bisect_left(self._keys, prefix), bisect_left(self._keys, prefix + "\uffff")
+        )
+
+    def find(self, name: str) -> int | None:
+        key = _key(name)
+        index = bisect_left(self._keys, key)
+
+        if index < len(self._keys) and self._keys[index] == key:
+            return index
+
+        return None
+
+    def suggest(self, name: str, limit: int = 3) -> list[int]:
+        """
+        Кандидаты отбираются по всё более короткому общему префиксу, пока не найдутся достаточно похожие, и
+        упорядочиваются по расстоянию Левенштейна. Слишком широкие диапазоны не просматриваются.
+        """
+        key = _key(name)
+        threshold = max(1, len(key) // 3)
+
+        for length in range(len(key), 0, -1):
+            candidates = self._range(key[:length])
+
+            if len(candidates) > self.max_candidates:
+                break
+
+            distances = sorted(
+                (distance, index)
+                for index in candidates
+                if (distance := _distance(key, self._keys[index], threshold))
+                <= threshold
+            )
+
+            if distances:
+                return [index for _, index in distances[:limit]]
+
+        return []
@@ -0,0 +1,126 @@
+from collections import OrderedDict
+from math import asin, ceil, cos, floor, radians, sin, sqrt
+from typing import Generic, TypeVar
+
+
+GEOHASH_ALPHABET = "0123456789bcdefghjkmnpqrstuvwxyz"
+EARTH_RADIUS = 6371.0
+KM_PER_DEGREE = 111.2
+
+
+def _bounds(
+    latitude: float, longitude: float, precision: int
+) -> tuple[str, list[float], list[float]]:
+    """
+    Ячейка геохеша получается попеременным делением пополам диапазонов долготы и широты, по 5 бит на символ.
+    """
+    latitudes, longitudes = [-90.0, 90.0], [-180.0, 180.0]
+    geohash, bits, value, even = [], 0, 0, True
+
+    while len(geohash) < precision:
+        interval, coordinate = (
+            (longitudes, longitude) if even else (latitudes, latitude)
+        )
+        middle = (interval[0] + interval[1]) / 2
+        value <<= 1
+
+        if coordinate >= middle:
+            value |= 1
+            interval[0] = middle
+        else:
+            interval[1] = middle
+
+        even = not even
+        bits += 1
+
+        if bits == 5:
+            geohash.append(GEOHASH_ALPHABET[value])
+            bits, value = 0, 0
+
+    return "".join(geohash), latitudes, longitudes
+
+
+def encode(latitude: float, longitude: float, precision: int) -> str:
+    return _bounds(latitude, longitude, precision)[0]
+
+
+def snap(latitude: float, longitude: float, precision: int) -> tuple[float, float]:
+    """
+    Возвращает центр ячейки геохеша, в которую попадает точка.
+    """
+    _, latitudes, longitudes = _bounds(latitude, longitude, precision)
+
+    return (latitudes[0] + latitudes[1]) / 2, (longitudes[0] + longitudes[1]) / 2
+
+
+def distance(first: tuple[float, float], second: tuple[float, float]) -> float:
+    """
+    Расстояние по поверхности Земли в километрах.
+    """
+    first_latitude, first_longitude = map(radians, first)
+    second_latitude, second_longitude = map(radians, second)
+    haversine = (
+        sin((second_latitude - first_latitude) / 2) ** 2
+        + cos(first_latitude)
+        * cos(second_latitude)
+        * sin((second_longitude - first_longitude) / 2) ** 2
+    )
+
+    return 2 * EARTH_RADIUS * asin(sqrt(haversine))
+
+
+ValueT = TypeVar("ValueT")
+
+
+class PointIndex(Generic[ValueT]):
+    """
+    Точки разложены по ячейкам сетки со стороной step градусов, поэтому поиск ближайшей точки просматривает только
+    ячейки в пределах радиуса. Число точек ограничено: при переполнении вытесняются самые давно добавленные.
+    """
+
+    def __init__(self, radius: float, max_size: int, step: float = 0.1) -> None:
+        self.radius: float = radius
+        self.max_size: int = max_size
+        self.step: float = step
+
+        self._cells: dict[tuple[int, int], dict[tuple[float, float], ValueT]] = {}
+        self._points: OrderedDict[tuple[float, float], None] = OrderedDict()
+
+    def _cell(self, point: tuple[float, float]) -> tuple[int, int]:
+        return floor(point[0] / self.step), floor(point[1] / self.step)
+
+    def add(self, latitude: float, longitude: float, value: ValueT) -> None:
+        point = (latitude, longitude)
+        self._cells.setdefault(self._cell(point), {})[point] = value
+        self._points[point] = None
+        self._points.move_to_end(point)
+
+        while len(self._points) > self.max_size:
+            evicted, _ = self._points.popitem(last=False)
+            cell = self._cell(evicted)
+            del self._cells[cell][evicted]
+
+            if not self._cells[cell]:
+                del self._cells[cell]
+
+    def nearest(self, latitude: float, longitude: float) -> ValueT | None:
+        point = (latitude, longitude)
+        row, column = self._cell(point)
+        # Ячейка по долготе сужается к полюсам, поэтому в пределы радиуса попадает больше ячеек.
+        rows = ceil(self.radius / (self.step * KM_PER_DEGREE))
+        columns = ceil(
+            self.radius
+            / (self.step * KM_PER_DEGREE * max(cos(radians(latitude)), 0.01))
+        )
+        found, shortest = None, self.radius
+
+        for i in range(row - rows, row + rows + 1):
+            for j in range(column - columns, column + columns + 1):
+                for other, value in self._cells.get((i, j), {}).items():
+                    if (length := distance(point, other)) <= shortest:
+                        found, shortest = value, length
+
+        return found
+
+    def __len__(self) -> int:
+        return len(self._points)
@@ -0,0 +1,70 @@
+from abc import ABC, abstractmethod
+from types import TracebackType
+from typing import Any
+
+from httpx import AsyncClient, Limits, Timeout
+
+from src.settings import http_settings
+
+
+class HTTPManager(ABC):
+    @property
+    @abstractmethod
+    def session(self) -> Any:
+        pass
+
+    @abstractmethod
+    async def __aenter__(self) -> None:
+        pass
+
+    @abstractmethod
+    async def __aexit__(
+        self,
+        exc_type: type[BaseException] | None,
+        exc_val: BaseException | None,
+        exc_tb: TracebackType | None,
+    ) -> None:
+        pass
+
+
+class HTTPXManager(HTTPManager):
+    """
+    Владеет общим пулом соединений с метеослужбами: соединения и TLS-сессии переиспользуются между запросами.
+    """
+
+    def __init__(self, settings: dict[str, Any]) -> None:
+        self.settings: dict[str, Any] = settings
+        self._session: AsyncClient | None = None
+
+    @property
+    def session(self) -> AsyncClient:
+        if self._session is None:
+            raise ValueError("Session is not initialized.")
+
+        return self._session
+
+    async def __aenter__(self) -> None:
+        self._session = AsyncClient(
+            limits=Limits(
+                max_connections=self.settings["max_connections"],
+                max_keepalive_connections=self.settings["max_keepalive_connections"],
+                keepalive_expiry=self.settings["keepalive_expiry"],
+            ),
+            timeout=Timeout(
+                self.settings["read_timeout"],
+                connect=self.settings["connect_timeout"],
+            ),
+            http2=self.settings["http2"],
+        )
+
+    async def __aexit__(
+        self,
+        exc_type: type[BaseException] | None,
+        exc_val: BaseException | None,
+        exc_tb: TracebackType | None,
+    ) -> None:
+        await self.session.aclose()
+        self._session = None
+
+
+http_manager: HTTPXManager = HTTPXManager(http_settings.model_dump())
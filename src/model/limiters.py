@@ -0,0 +1,69 @@
+import asyncio
+from collections import OrderedDict
+from time import monotonic
+
+
+class TokenBucket:
+    """
+    Корзина пополняется с постоянной скоростью до заданной ёмкости, каждый вызов расходует из неё маркер. Ёмкость
+    допускает кратковременный всплеск, скорость — ограничивает средний темп.
+    """
+
+    def __init__(self, rate: float, capacity: float) -> None:
+        self.rate: float = rate
+        self.capacity: float = capacity
+
+        self._tokens: float = capacity
+        self._updated_at: float = monotonic()
+
+    @property
+    def tokens(self) -> float:
+        now = monotonic()
+        self._tokens = min(
+            self.capacity, self._tokens + (now - self._updated_at) * self.rate
+        )
+        self._updated_at = now
+
+        return self._tokens
+
+    def consume(self, amount: float = 1.0) -> bool:
+        if self.tokens < amount:
+            return False
+
+        self._tokens -= amount
+
+        return True
+
+    async def acquire(self, amount: float = 1.0) -> None:
+        """
+        Дожидается, пока в корзине наберётся нужное число маркеров, и расходует их.
+        """
+        while not self.consume(amount):
+            await asyncio.sleep((amount - self._tokens) / self.rate)
+
+
+class RateLimiter:
+    """
+    Отдельная корзина для каждого ключа. Число корзин ограничено: давно не использованные вытесняются, а вытесненный
+    ключ получает полную корзину, что равносильно долгому простою.
+    """
+
+    def __init__(self, rate: float, capacity: float, max_size: int) -> None:
+        self.rate: float = rate
+        self.capacity: float = capacity
+        self.max_size: int = max_size
+
+        self._buckets: OrderedDict[int | str, TokenBucket] = OrderedDict()
+
+    def allow(self, key: int | str) -> bool:
+        try:
+            bucket = self._buckets[key]
+        except KeyError:
+            bucket = self._buckets[key] = TokenBucket(self.rate, self.capacity)
+
+            if len(self._buckets) > self.max_size:
+                self._buckets.popitem(last=False)
+        else:
+            self._buckets.move_to_end(key)
+
+        return bucket.consume()
@@ -0,0 +1,79 @@
+from datetime import UTC, date, datetime
+
+from src.model.db import DBManager
+from src.model.repositories import Repository
+
+
+def _today() -> date:
+    return datetime.now(UTC).date()
+
+
+class Quota:
+    """
+    Суточная квота обращений к службе. Расход учитывается в памяти и периодически сводится с БД, где складывается
+    расход всех экземпляров бота, поэтому квота переживает перезапуск. Между сведениями экземпляры могут немного
+    превысить квоту, что покрывается запасом, который оставляет агрегирующий клиент.
+    """
+
+    def __init__(
+        self,
+        service: str,
+        limit: int,
+        repository: Repository,
+        db_manager: DBManager,
+    ) -> None:
+        self.service: str = service
+        self.limit: int = limit
+        self.repository: Repository = repository
+        self.db_manager: DBManager = db_manager
+
+        self.used: int = 0
+
+        self._day: date = _today()
+        self._pending: int = 0
+
+    def _roll(self) -> None:
+        day = _today()
+
+        if day != self._day:
+            self._day, self.used, self._pending = day, 0, 0
+
+    @property
+    def usage(self) -> float:
+        self._roll()
+
+        return min(self.used / self.limit, 1.0)
+
+    @property
+    def is_exhausted(self) -> bool:
+        return self.usage >= 1.0
+
+    def consume(self) -> bool:
+        if self.is_exhausted:
+            return False
+
+        self.used += 1
+        self._pending += 1
+
+        return True
+
+    async def sync(self) -> None:
+        """
+        Записывает накопленный расход и получает суммарный расход всех экземпляров за день.
+        """
+        self._roll()
+        day, pending = self._day, self._pending
+        self._pending = 0
+
+        try:
+            async with self.db_manager.begin() as conn:
+                used = await self.repository.add_quota_usage(
+                    self.service, day, pending, conn
+                )
+        except BaseException:
+            if day == self._day:
+                self._pending += pending
+            raise
+
+        if day == self._day:
+            self.used = used + self._pending
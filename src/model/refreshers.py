@@ -0,0 +1,64 @@
+import asyncio
+from datetime import datetime, timedelta
+
+from pydantic import ValidationError
+
+from src.model.db import DBManager
+from src.model.repositories import Repository
+from src.model.weather_clients import AggregatedWeatherClient
+from src.presenter.errors import ExternalError
+from src.presenter.schemas import PydanticLocalityShort
+from src.settings import LOGGER
+
+
+class Refresher:
+    """
+    Заранее обновляет наблюдения о населённых пунктах, о которых чаще всего спрашивали за последнее время, чтобы
+    запросы о них обслуживались из кэша. Обновление откладывается, когда квоты служб начинают заканчиваться: расход
+    на упреждающие запросы не должен лишать пользователей ответов.
+    """
+
+    def __init__(
+        self,
+        weather_client: AggregatedWeatherClient,
+        repository: Repository,
+        db_manager: DBManager,
+        top: int = 10,
+        window: float = 604800.0,
+        concurrency: int = 4,
+    ) -> None:
+        self.weather_client: AggregatedWeatherClient = weather_client
+        self.repository: Repository = repository
+        self.db_manager: DBManager = db_manager
+        self.top: int = top
+        self.window: float = window
+
+        self._requests: asyncio.Semaphore = asyncio.Semaphore(concurrency)
+
+    async def _refresh_one(self, name: str) -> None:
+        try:
+            locality = PydanticLocalityShort(name=name)
+        except ValidationError:
+            # Точки в истории хранятся под условным названием, по которому координаты не восстановить.
+            return
+
+        async with self._requests:
+            if self.weather_client.is_saving:
+                return
+
+            try:
+                await self.weather_client.refresh(locality)
+            except ExternalError:
+                LOGGER.warning("Failed to refresh weather in %s.", name)
+
+    async def refresh(self) -> None:
+        if self.weather_client.is_saving:
+            LOGGER.info("Refresh is postponed to save weather service quotas.")
+            return
+
+        async with self.db_manager.begin(read_only=True) as conn:
+            names = await self.repository.get_popular_localities(
+                self.top, datetime.now() - timedelta(seconds=self.window), conn
+            )
+
+        await asyncio.gather(*(self._refresh_one(name) for name in names))
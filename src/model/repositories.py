@@ -1,33 +1,135 @@
 from abc import ABC, abstractmethod
+from datetime import date, datetime, time
 from typing import Any
 
 from asyncpg import Connection, Record, UniqueViolationError
 
 from src.presenter.errors import AlreadyExistsError
 from src.presenter.schemas import (
-    HistoryRecordShort,
+    HistoryCursor,
+    HistoryRecord,
+    PydanticHistoryCursor,
     PydanticHistoryRecord,
-    PydanticHistoryRecordShort,
+    PydanticSubscription,
     PydanticUser,
+    Subscription,
     User,
-    UserShort,
-    many_from_dict,
 )
 
 
+MEASUREMENT_FIELDS = (
+    "service",
+    "summary",
+    "real_temperature",
+    "feels_like_temperature",
+    "atmospheric_pressure",
+    "wind_speed",
+    "cloudiness",
+    "humidity",
+    "unavailable_services",
+)
+
+PAGE_QUERY = f"""
+SELECT
+    h.id, h.user_id, h.timestamp,
+    o.id AS observation_id, o.locality, o.timestamp AS observed_at,
+    {", ".join(f"m.{field}" for field in MEASUREMENT_FIELDS)}
+FROM (
+    SELECT * FROM history
+    WHERE {{condition}}
+    ORDER BY timestamp {{direction}}, id {{direction}}
+    LIMIT {{limit}}
+) AS h
+JOIN observations AS o ON o.id = h.observation_id
+JOIN measurements AS m ON m.observation_id = o.id
+ORDER BY h.timestamp {{direction}}, h.id {{direction}}, m.position
+"""
+
+
 class Repository(ABC):
     @abstractmethod
     async def create_user(self, user: User, conn: Any) -> None:
         pass
 
     @abstractmethod
-    async def get_all_records(
-        self, history: HistoryRecordShort, conn: Any
-    ) -> list[Any]:
+    async def get_records(self, cursor: HistoryCursor, conn: Any) -> list[Any]:
+        pass
+
+    @abstractmethod
+    async def create_records(self, history: list[HistoryRecord], conn: Any) -> None:
         pass
 
     @abstractmethod
-    async def create_record(self, history: UserShort, conn: Any) -> None:
+    async def get_popular_localities(
+        self, limit: int, since: datetime, conn: Any
+    ) -> list[str]:
+        pass
+
+    @abstractmethod
+    async def get_geocoding(
+        self, key: str, ttl: float | None, conn: Any
+    ) -> tuple[str, float] | None:
+        """
+        Возвращает значение и его возраст в секундах.
+        """
+        pass
+
+    @abstractmethod
+    async def create_geocoding(
+        self, key: str, value: str, age: float, conn: Any
+    ) -> None:
+        pass
+
+    @abstractmethod
+    async def add_quota_usage(
+        self, service: str, day: date, amount: int, conn: Any
+    ) -> int:
+        pass
+
+    @abstractmethod
+    async def get_subscribed_localities(self, user_id: int, conn: Any) -> list[str]:
+        pass
+
+    @abstractmethod
+    async def create_subscription(
+        self, subscription: Subscription, limit: int, conn: Any
+    ) -> bool:
+        pass
+
+    @abstractmethod
+    async def delete_subscriptions(
+        self, user_id: int, locality: str | None, conn: Any
+    ) -> int:
+        pass
+
+    @abstractmethod
+    async def get_due_subscriptions(
+        self, time_: time, conn: Any
+    ) -> list[tuple[str, list[int]]]:
+        pass
+
+    @abstractmethod
+    async def claim_subscription_run(self, minute: datetime, conn: Any) -> bool:
+        pass
+
+    @abstractmethod
+    async def get_state(
+        self, key: str, ttl: float | None, conn: Any
+    ) -> tuple[str | None, dict[str, Any]] | None:
+        pass
+
+    @abstractmethod
+    async def update_state(self, key: str, state: str | None, conn: Any) -> None:
+        pass
+
+    @abstractmethod
+    async def update_state_data(
+        self, key: str, data: dict[str, Any], conn: Any
+    ) -> None:
+        pass
+
+    @abstractmethod
+    async def delete_expired_states(self, ttl: float, conn: Any) -> int:
         pass
 
 
@@ -38,18 +140,306 @@ class AsyncpgRepository(Repository):
         except UniqueViolationError:
             raise AlreadyExistsError
 
-    @many_from_dict(PydanticHistoryRecord)
-    async def get_all_records(
-        self, history: PydanticHistoryRecordShort, conn: Connection
-    ) -> list[Record]:
-        return await conn.fetch(
-            "SELECT * FROM history WHERE user_id = $1", *history.to_tuple()
+    @staticmethod
+    def _assemble(rows: list[Record]) -> list[PydanticHistoryRecord]:
+        """
+        Каждая строка выборки — одно измерение, поэтому записи истории собираются из нескольких подряд идущих строк.
+        """
+        history = {}
+
+        for row in rows:
+            record = history.setdefault(
+                row["id"],
+                {
+                    "id": row["id"],
+                    "user_id": row["user_id"],
+                    "timestamp": row["timestamp"],
+                    "observation": {
+                        "id": row["observation_id"],
+                        "locality": row["locality"],
+                        "timestamp": row["observed_at"],
+                        "weather": [],
+                    },
+                },
+            )
+            record["observation"]["weather"].append(
+                {
+                    field: row[field]
+                    for field in MEASUREMENT_FIELDS
+                    if row[field] is not None
+                }
+            )
+
+        return [PydanticHistoryRecord(**record) for record in history.values()]
+
+    async def get_records(
+        self, cursor: PydanticHistoryCursor, conn: Connection
+    ) -> list[PydanticHistoryRecord]:
+        """
+        Постраничная выборка по ключу (без OFFSET) использует индекс по (user_id, timestamp) и не замедляется по мере
+        удаления от начала истории. Запрашивается на одну запись больше размера страницы, чтобы понять, есть ли
+        следующая. Наблюдения присоединяются уже к отобранной странице.
+        """
+        if cursor.timestamp is None:
+            query = PAGE_QUERY.format(
+                condition="user_id = $1", direction="DESC", limit="$2"
+            )
+            args = (cursor.user_id, cursor.size + 1)
+        else:
+            query = PAGE_QUERY.format(
+                condition=(
+                    "user_id = $1 AND (timestamp, id) > ($2, $3)"
+                    if cursor.backward
+                    else "user_id = $1 AND (timestamp, id) < ($2, $3)"
+                ),
+                direction="ASC" if cursor.backward else "DESC",
+                limit="$4",
+            )
+            args = (cursor.user_id, cursor.timestamp, cursor.id, cursor.size + 1)
+
+        return self._assemble(await conn.fetch(query, *args))
+
+    async def create_records(
+        self, history: list[PydanticHistoryRecord], conn: Connection
+    ) -> None:
+        """
+        Наблюдение, уже сохранённое по запросу другого пользователя, повторно не записывается.
+        """
+        observations = {record.observation.id: record.observation for record in history}
+        created = await conn.fetch(
+            """
+            INSERT INTO observations (id, locality, timestamp)
+            SELECT * FROM unnest($1::uuid[], $2::text[], $3::timestamp[])
+            ON CONFLICT DO NOTHING
+            RETURNING id
+            """,
+            list(observations),
+            [observation.locality for observation in observations.values()],
+            [observation.timestamp for observation in observations.values()],
+        )
+
+        await conn.executemany(
+            f"""
+            INSERT INTO measurements (observation_id, position, {", ".join(MEASUREMENT_FIELDS)})
+            VALUES ($1, $2, {", ".join(f"${i}" for i in range(3, len(MEASUREMENT_FIELDS) + 3))})
+            """,
+            [
+                (
+                    row["id"],
+                    position,
+                    *(getattr(weather, field) for field in MEASUREMENT_FIELDS),
+                )
+                for row in created
+                for position, weather in enumerate(observations[row["id"]].weather)
+            ],
+        )
+
+        await conn.executemany(
+            "INSERT INTO history (user_id, observation_id) VALUES ($1, $2)",
+            [(record.user_id, record.observation.id) for record in history],
+        )
+
+    async def get_popular_localities(
+        self, limit: int, since: datetime, conn: Connection
+    ) -> list[str]:
+        """
+        Ограничение по времени отсекает старые секции истории.
+        """
+        rows = await conn.fetch(
+            """
+            SELECT o.locality FROM history AS h
+            JOIN observations AS o ON o.id = h.observation_id
+            WHERE h.timestamp >= $1
+            GROUP BY o.locality
+            ORDER BY COUNT(*) DESC
+            LIMIT $2
+            """,
+            since,
+            limit,
+        )
+
+        return [row["locality"] for row in rows]
+
+    async def get_geocoding(
+        self, key: str, ttl: float | None, conn: Connection
+    ) -> tuple[str, float] | None:
+        row = await conn.fetchrow(
+            """
+            SELECT value, EXTRACT(EPOCH FROM NOW() - timestamp)::float8 AS age FROM geocoding
+            WHERE key = $1
+            AND ($2::float8 IS NULL OR timestamp > NOW() - make_interval(secs => $2))
+            """,
+            key,
+            ttl,
+        )
+
+        return None if row is None else (row["value"], row["age"])
+
+    async def create_geocoding(
+        self, key: str, value: str, age: float, conn: Connection
+    ) -> None:
+        await conn.execute(
+            """
+            INSERT INTO geocoding (key, value, timestamp) VALUES ($1, $2, NOW() - make_interval(secs => $3))
+            ON CONFLICT (key) DO UPDATE SET value = EXCLUDED.value, timestamp = EXCLUDED.timestamp
+            """,
+            key,
+            value,
+            age,
+        )
+
+    async def add_quota_usage(
+        self, service: str, day: date, amount: int, conn: Connection
+    ) -> int:
+        return await conn.fetchval(
+            """
+            INSERT INTO quotas (service, day, used) VALUES ($1, $2, $3)
+            ON CONFLICT (service, day) DO UPDATE SET used = quotas.used + EXCLUDED.used
+            RETURNING used
+            """,
+            service,
+            day,
+            amount,
+        )
+
+    async def get_subscribed_localities(
+        self, user_id: int, conn: Connection
+    ) -> list[str]:
+        rows = await conn.fetch(
+            "SELECT locality FROM subscriptions WHERE user_id = $1", user_id
+        )
+
+        return [row["locality"] for row in rows]
+
+    async def create_subscription(
+        self, subscription: PydanticSubscription, limit: int, conn: Connection
+    ) -> bool:
+        """
+        Новая подписка не создаётся, если у пользователя уже есть limit других. Время существующей можно изменить.
+        """
+        return (
+            await conn.fetchval(
+                """
+                INSERT INTO subscriptions (user_id, locality, time)
+                SELECT $1, $2, $3
+                WHERE (
+                    SELECT COUNT(*) FROM subscriptions WHERE user_id = $1 AND locality <> $2
+                ) < $4
+                ON CONFLICT (user_id, locality) DO UPDATE SET time = EXCLUDED.time
+                RETURNING TRUE
+                """,
+                *subscription.to_tuple(),
+                limit,
+            )
+            is not None
+        )
+
+    async def delete_subscriptions(
+        self, user_id: int, locality: str | None, conn: Connection
+    ) -> int:
+        status = await conn.execute(
+            "DELETE FROM subscriptions WHERE user_id = $1 AND ($2::text IS NULL OR locality = $2)",
+            user_id,
+            locality,
+        )
+
+        return int(status.split()[-1])
+
+    async def get_due_subscriptions(
+        self, time_: time, conn: Connection
+    ) -> list[tuple[str, list[int]]]:
+        """
+        Подписки группируются по населённому пункту, чтобы каждый запрашивался у метеослужб один раз.
+        """
+        rows = await conn.fetch(
+            """
+            SELECT locality, array_agg(user_id) AS user_ids FROM subscriptions
+            WHERE time = $1
+            GROUP BY locality
+            """,
+            time_,
+        )
+
+        return [(row["locality"], row["user_ids"]) for row in rows]
+
+    async def claim_subscription_run(self, minute: datetime, conn: Connection) -> bool:
+        """
+        Рассылку за минуту выполняет тот экземпляр бота, который первым её заявил.
+        """
+        await conn.execute(
+            "DELETE FROM subscription_runs WHERE minute < $1::timestamp - INTERVAL '1 day'",
+            minute,
+        )
+
+        return (
+            await conn.fetchval(
+                """
+                INSERT INTO subscription_runs (minute) VALUES ($1)
+                ON CONFLICT DO NOTHING
+                RETURNING minute
+                """,
+                minute,
+            )
+            is not None
+        )
+
+    async def get_state(
+        self, key: str, ttl: float | None, conn: Connection
+    ) -> tuple[str | None, dict[str, Any]] | None:
+        row = await conn.fetchrow(
+            """
+            SELECT state, data FROM fsm
+            WHERE key = $1
+            AND ($2::float8 IS NULL OR timestamp > NOW() - make_interval(secs => $2))
+            """,
+            key,
+            ttl,
         )
 
-    async def create_record(
-        self, history: PydanticHistoryRecord, conn: Connection
+        return None if row is None else (row["state"], row["data"])
+
+    @staticmethod
+    async def _compact_state(key: str, conn: Connection) -> None:
+        """
+        Пустая запись ничем не отличается от отсутствующей, поэтому не хранится.
+        """
+        await conn.execute(
+            "DELETE FROM fsm WHERE key = $1 AND state IS NULL AND data = '{}'::jsonb",
+            key,
+        )
+
+    async def update_state(self, key: str, state: str | None, conn: Connection) -> None:
+        await conn.execute(
+            """
+            INSERT INTO fsm (key, state) VALUES ($1, $2)
+            ON CONFLICT (key) DO UPDATE SET state = EXCLUDED.state, timestamp = NOW()
+            """,
+            key,
+            state,
+        )
+
+        if state is None:
+            await self._compact_state(key, conn)
+
+    async def update_state_data(
+        self, key: str, data: dict[str, Any], conn: Connection
     ) -> None:
         await conn.execute(
-            "INSERT INTO history (user_id, locality, weather) VALUES ($1, $2, $3)",
-            *history.to_tuple(exclude_none=True),
+            """
+            INSERT INTO fsm (key, data) VALUES ($1, $2)
+            ON CONFLICT (key) DO UPDATE SET data = EXCLUDED.data, timestamp = NOW()
+            """,
+            key,
+            data,
+        )
+
+        if not data:
+            await self._compact_state(key, conn)
+
+    async def delete_expired_states(self, ttl: float, conn: Connection) -> int:
+        status = await conn.execute(
+            "DELETE FROM fsm WHERE timestamp < NOW() - make_interval(secs => $1)",
+            ttl,
         )
+
+        return int(status.split()[-1])
@@ -0,0 +1,50 @@
+import asyncio
+from collections.abc import Awaitable, Callable
+from types import TracebackType
+
+from src.settings import LOGGER
+
+
+class Scheduler:
+    """
+    Периодически выполняет фоновые задачи в пределах процесса. Ошибка задачи журналируется и не прерывает
+    последующие запуски.
+    """
+
+    def __init__(self) -> None:
+        self._jobs: list[tuple[float, Callable[[], Awaitable[None]]]] = []
+        self._tasks: list[asyncio.Task] = []
+
+    def every(self, interval: float, job: Callable[[], Awaitable[None]]) -> None:
+        self._jobs.append((interval, job))
+
+    @staticmethod
+    async def _run(interval: float, job: Callable[[], Awaitable[None]]) -> None:
+        while True:
+            try:
+                await job()
+            except Exception:
+                LOGGER.exception("Scheduled job %s failed.", job.__qualname__)
+
+            await asyncio.sleep(interval)
+
+    async def __aenter__(self) -> None:
+        self._tasks = [
+            asyncio.create_task(self._run(interval, job))
+            for interval, job in self._jobs
+        ]
+
+    async def __aexit__(
+        self,
+        exc_type: type[BaseException] | None,
+        exc_val: BaseException | None,
+        exc_tb: TracebackType | None,
+    ) -> None:
+        for task in self._tasks:
+            task.cancel()
+
+        await asyncio.gather(*self._tasks, return_exceptions=True)
+        self._tasks = []
+
+
+scheduler: Scheduler = Scheduler()
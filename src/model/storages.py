@@ -0,0 +1,97 @@
+from collections.abc import Mapping
+from typing import Any
+
+from aiogram.fsm.state import State
+from aiogram.fsm.storage.base import (
+    BaseStorage,
+    DefaultKeyBuilder,
+    KeyBuilder,
+    StateType,
+    StorageKey,
+)
+
+from src.model.caches import Cache
+from src.model.db import DBManager
+from src.model.repositories import Repository
+
+
+class DBStorage(BaseStorage):
+    """
+    Хранилище состояний в БД позволяет запускать несколько экземпляров бота и перезапускать их, не прерывая диалогов.
+    Состояния, не менявшиеся дольше ttl, считаются устаревшими. Сквозной кэш в памяти избавляет от обращения к БД на
+    каждое сообщение, но годится, только если сообщения одного пользователя обрабатывает один экземпляр. Состояние
+    запрашивается для каждого обновления, поэтому без кэша читается одним запросом вне транзакции.
+    """
+
+    def __init__(
+        self,
+        repository: Repository,
+        db_manager: DBManager,
+        ttl: float | None = None,
+        cache: Cache | None = None,
+        key_builder: KeyBuilder | None = None,
+    ) -> None:
+        self.repository: Repository = repository
+        self.db_manager: DBManager = db_manager
+        self.ttl: float | None = ttl
+        self.cache: Cache | None = cache
+        self.key_builder: KeyBuilder = key_builder or DefaultKeyBuilder()
+
+    async def _load(self, key: str) -> tuple[str | None, dict[str, Any]]:
+        if self.cache is not None:
+            entry = await self.cache.get(key)
+
+            if entry is not None:
+                return entry
+
+        async with self.db_manager.acquire() as conn:
+            entry = await self.repository.get_state(key, self.ttl, conn) or (None, {})
+
+        if self.cache is not None:
+            await self.cache.set(key, entry)
+
+        return entry
+
+    async def set_state(self, key: StorageKey, state: StateType = None) -> None:
+        built = self.key_builder.build(key)
+        state = state.state if isinstance(state, State) else state
+
+        async with self.db_manager.begin() as conn:
+            await self.repository.update_state(built, state, conn)
+
+        if self.cache is not None:
+            _, data = await self._load(built)
+            await self.cache.set(built, (state, data))
+
+    async def get_state(self, key: StorageKey) -> str | None:
+        state, _ = await self._load(self.key_builder.build(key))
+
+        return state
+
+    async def set_data(self, key: StorageKey, data: Mapping[str, Any]) -> None:
+        built = self.key_builder.build(key)
+        data = dict(data)
+
+        async with self.db_manager.begin() as conn:
+            await self.repository.update_state_data(built, data, conn)
+
+        if self.cache is not None:
+            state, _ = await self._load(built)
+            await self.cache.set(built, (state, data))
+
+    async def get_data(self, key: StorageKey) -> dict[str, Any]:
+        _, data = await self._load(self.key_builder.build(key))
+
+        return dict(data)
+
+    async def expire(self) -> None:
+        if self.ttl is None:
+            return
+
+        async with self.db_manager.begin() as conn:
+            await self.repository.delete_expired_states(self.ttl, conn)
+
+    async def close(self) -> None:
+        """
+        Пулом соединений владеет менеджер БД.
+        """
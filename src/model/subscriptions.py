@@ -0,0 +1,121 @@
+import asyncio
+from collections.abc import Awaitable, Callable
+from datetime import datetime, timedelta, timezone
+from types import TracebackType
+
+from src.model.db import DBManager
+from src.model.repositories import Repository
+from src.model.weather_clients import AggregatedWeatherClient
+from src.presenter.errors import ExternalError
+from src.presenter.schemas import PydanticLocalityShort, PydanticObservation
+from src.settings import LOGGER
+
+
+Deliver = Callable[[PydanticObservation, list[int]], Awaitable[None]]
+
+
+class SubscriptionRunner:
+    """
+    Выбирает подписки, время которых наступило, группирует их по населённым пунктам, запрашивает погоду в каждом один
+    раз и передаёт её для рассылки всем подписчикам сразу. Минуту обрабатывает экземпляр бота, первым заявивший её,
+    поэтому рассылка не дублируется. Минуты, пропущенные, например, из-за перезапуска, наверстываются в пределах
+    catch_up. Рассылка идёт в фоне, чтобы долгая рассылка одной минуты не задерживала заявку следующих.
+    """
+
+    def __init__(
+        self,
+        weather_client: AggregatedWeatherClient,
+        repository: Repository,
+        db_manager: DBManager,
+        utc_offset: float = 3.0,
+        catch_up: int = 5,
+        concurrency: int = 4,
+    ) -> None:
+        self.weather_client: AggregatedWeatherClient = weather_client
+        self.repository: Repository = repository
+        self.db_manager: DBManager = db_manager
+        self.timezone: timezone = timezone(timedelta(hours=utc_offset))
+        self.catch_up: int = catch_up
+
+        self._requests: asyncio.Semaphore = asyncio.Semaphore(concurrency)
+        self._last: datetime | None = None
+        self._deliveries: set[asyncio.Task] = set()
+
+    def _due_minutes(self) -> list[datetime]:
+        now = datetime.now(self.timezone).replace(second=0, microsecond=0, tzinfo=None)
+        minute = now - timedelta(minutes=self.catch_up)
+
+        if self._last is not None:
+            minute = max(minute, self._last + timedelta(minutes=1))
+
+        minutes = []
+
+        while minute <= now:
+            minutes.append(minute)
+            minute += timedelta(minutes=1)
+
+        return minutes
+
+    async def _run_locality(
+        self, name: str, user_ids: list[int], deliver: Deliver
+    ) -> None:
+        # Рассылка идёт вне семафора, чтобы не задерживать запросы о других населённых пунктах.
+        async with self._requests:
+            try:
+                observation = await self.weather_client.get(
+                    PydanticLocalityShort(name=name)
+                )
+            except ExternalError:
+                LOGGER.warning(
+                    "Failed to get weather in %s for %d subscribers.",
+                    name,
+                    len(user_ids),
+                )
+                return
+
+        await deliver(observation, user_ids)
+
+    async def _run_minute(
+        self, minute: datetime, due: list[tuple[str, list[int]]], deliver: Deliver
+    ) -> None:
+        try:
+            await asyncio.gather(
+                *(self._run_locality(name, user_ids, deliver) for name, user_ids in due)
+            )
+        except Exception:
+            LOGGER.exception("Subscriptions for %s failed.", minute)
+
+    async def run(self, deliver: Deliver) -> None:
+        for minute in self._due_minutes():
+            async with self.db_manager.begin() as conn:
+                due = (
+                    await self.repository.get_due_subscriptions(minute.time(), conn)
+                    if await self.repository.claim_subscription_run(minute, conn)
+                    else []
+                )
+
+            self._last = minute
+
+            if due:
+                delivery = asyncio.create_task(self._run_minute(minute, due, deliver))
+                self._deliveries.add(delivery)
+                delivery.add_done_callback(self._deliveries.discard)
+
+    async def __aenter__(self) -> None:
+        pass
+
+    async def __aexit__(
+        self,
+        exc_type: type[BaseException] | None,
+        exc_val: BaseException | None,
+        exc_tb: TracebackType | None,
+    ) -> None:
+        if self._deliveries:
+            LOGGER.warning(
+                "%d subscription deliveries are interrupted.", len(self._deliveries)
+            )
+
+        for delivery in self._deliveries:
+            delivery.cancel()
+
+        await asyncio.gather(*self._deliveries, return_exceptions=True)
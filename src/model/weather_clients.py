@@ -1,17 +1,28 @@
 import asyncio
 from abc import ABC, abstractmethod
+from collections.abc import AsyncIterator, Awaitable, Callable
+from functools import partial
 from statistics import mean
+from time import monotonic
 from typing import Any
 
-from httpx import AsyncClient, HTTPStatusError, RequestError
+from httpx import AsyncClient, HTTPStatusError, RequestError, Response, Timeout
 
-from src.presenter.errors import ExternalError
+from src.model.breakers import CircuitBreaker
+from src.model.caches import Cache
+from src.model.coalescing import Progress, SingleFlight
+from src.model.geo import PointIndex
+from src.model.http import HTTPManager
+from src.model.quotas import Quota
+from src.presenter.errors import ExternalError, LimitExceededError
 from src.presenter.schemas import (
-    Locality,
-    PydanticLocality,
+    LocalityShort,
+    PydanticLocalityShort,
+    PydanticObservation,
+    PydanticPositionShort,
     PydanticWeather,
-    many_from_dict,
 )
+from src.settings import LOGGER
 
 
 class WeatherClient(ABC):
@@ -20,15 +31,98 @@ class WeatherClient(ABC):
     weather_endpoint: str
     locality_endpoint: str
 
-    def __init__(self, key: str, timeout: int = 10) -> None:
+    def __init__(
+        self,
+        key: str,
+        max_connections: int | None = None,
+        geocoding_cache: Cache | None = None,
+        breaker: CircuitBreaker | None = None,
+        quota: Quota | None = None,
+    ) -> None:
+        """
+        Общий пул соединений не ограничивает их число для отдельного узла, поэтому это делает сам клиент. Квота
+        расходуется на каждый запрос, действительно отправленный службе, включая геокодирование: вызовы, отклонённые
+        разомкнутой цепью, её не тратят.
+        """
         self.key: str = key
-        self.timeout: int = timeout
+        self.geocoding_cache: Cache | None = geocoding_cache
+        self.breaker: CircuitBreaker | None = breaker
+        self.quota: Quota | None = quota
+
+        self._connections: asyncio.Semaphore | None = (
+            None if max_connections is None else asyncio.Semaphore(max_connections)
+        )
+
+    async def _send(self, endpoint: str, session: AsyncClient, **kwargs) -> Response:
+        if self._connections is None:
+            return await session.get(endpoint, **kwargs)
+
+        async with self._connections:
+            return await session.get(endpoint, **kwargs)
+
+    @property
+    def usage(self) -> float:
+        return 0.0 if self.quota is None else self.quota.usage
+
+    @property
+    def is_exhausted(self) -> bool:
+        return self.quota is not None and self.quota.is_exhausted
 
     async def _request(
         self, endpoint: str, session: AsyncClient, **kwargs
+    ) -> list[dict[str, Any]]:
+        if self.breaker is not None and not self.breaker.allow():
+            raise ExternalError(f"{self.service} circuit is open.")
+
+        if self.quota is not None and not self.quota.consume():
+            # Пробный вызов не состоялся, поэтому не должен блокировать следующий.
+            if self.breaker is not None:
+                self.breaker.abandon()
+
+            raise LimitExceededError(f"{self.service} quota is exhausted.")
+
+        if self.breaker is None:
+            return await self._request_unguarded(endpoint, session, **kwargs)
+
+        # Подстроенный тайм-аут лишь сокращает настроенный для пула.
+        timeout = self.breaker.timeout
+
+        if session.timeout.read is not None:
+            timeout = min(timeout, session.timeout.read)
+
+        started = monotonic()
+
+        try:
+            body = await self._request_unguarded(
+                endpoint,
+                session,
+                timeout=Timeout(timeout, connect=session.timeout.connect),
+                **kwargs,
+            )
+        except ExternalError:
+            self.breaker.record(False, monotonic() - started)
+            raise
+        except BaseException:
+            self.breaker.abandon()
+            raise
+
+        self.breaker.record(True, monotonic() - started)
+
+        return body
+
+    def miss_deadline(self, latency: float) -> None:
+        """
+        Вызов, не уложившийся в отведённое агрегатором время, отменяется, но для автомата это неудача: иначе служба,
+        всегда отвечающая позже, никогда не разомкнула бы цепь и продолжала бы тратить квоту впустую.
+        """
+        if self.breaker is not None:
+            self.breaker.record(False, latency)
+
+    async def _request_unguarded(
+        self, endpoint: str, session: AsyncClient, **kwargs
     ) -> list[dict[str, Any]]:
         try:
-            response = await session.get(endpoint, timeout=self.timeout, **kwargs)
+            response = await self._send(endpoint, session, **kwargs)
         except RequestError:
             raise ExternalError
 
@@ -39,8 +133,29 @@ class WeatherClient(ABC):
 
         return response.json()
 
+    async def _geocode(
+        self,
+        locality: PydanticLocalityShort | PydanticPositionShort,
+        session: AsyncClient,
+        resolve: Callable[[Any, AsyncClient], Awaitable[Any]],
+    ) -> Any:
+        """
+        Результат геокодирования практически не меняется, поэтому повторный запрос к службе не нужен.
+        """
+        if self.geocoding_cache is None:
+            return await resolve(locality, session)
+
+        key = f"{self.service}:{locality.normalized_name}"
+        value = await self.geocoding_cache.get(key)
+
+        if value is None:
+            value = await resolve(locality, session)
+            await self.geocoding_cache.set(key, value)
+
+        return value
+
     @abstractmethod
-    async def get(self, locality: Locality, session: Any) -> dict[str, Any]:
+    async def get(self, locality: LocalityShort, session: Any) -> dict[str, Any]:
         pass
 
 
@@ -49,9 +164,30 @@ class AccuWeatherClient(WeatherClient):
 
     weather_endpoint = "http://dataservice.accuweather.com/currentconditions/v1"
     locality_endpoint = "http://dataservice.accuweather.com/locations/v1/cities/search"
+    position_endpoint = (
+        "http://dataservice.accuweather.com/locations/v1/cities/geoposition/search"
+    )
+
+    def __init__(
+        self, *args: Any, positions: PointIndex[str] | None = None, **kwargs: Any
+    ) -> None:
+        """
+        Служба знает погоду только для своих населённых пунктов, поэтому точка сопоставляется ближайшему из уже
+        найденных, и лишь при его отсутствии служба опрашивается по координатам.
+        """
+        super().__init__(*args, **kwargs)
+        self.positions: PointIndex[str] | None = positions
+
+    def _remember_position(self, body: dict[str, Any]) -> None:
+        if self.positions is not None and "GeoPosition" in body:
+            self.positions.add(
+                body["GeoPosition"]["Latitude"],
+                body["GeoPosition"]["Longitude"],
+                body["Key"],
+            )
 
     async def _get_locality_id(
-        self, locality: PydanticLocality, session: AsyncClient
+        self, locality: PydanticLocalityShort, session: AsyncClient
     ) -> str:
         body = await self._request(
             self.locality_endpoint,
@@ -64,10 +200,39 @@ class AccuWeatherClient(WeatherClient):
         )
 
         try:
-            return body[0]["Key"]
+            body = body[0]
         except IndexError:
             raise ExternalError
 
+        self._remember_position(body)
+
+        return body["Key"]
+
+    async def _get_position_id(
+        self, position: PydanticPositionShort, session: AsyncClient
+    ) -> str:
+        if self.positions is not None:
+            id_ = self.positions.nearest(position.latitude, position.longitude)
+
+            if id_ is not None:
+                return id_
+
+        body = await self._request(
+            self.position_endpoint,
+            session,
+            params={
+                "apikey": self.key,
+                "q": f"{position.latitude},{position.longitude}",
+            },
+        )
+
+        if not isinstance(body, dict) or "Key" not in body:
+            raise ExternalError
+
+        self._remember_position(body)
+
+        return body["Key"]
+
     async def _get_weather(self, id_: str, session: AsyncClient) -> dict[str, Any]:
         return (
             await self._request(
@@ -82,9 +247,17 @@ class AccuWeatherClient(WeatherClient):
         )[0]
 
     async def get(
-        self, locality: PydanticLocality, session: AsyncClient
+        self,
+        locality: PydanticLocalityShort | PydanticPositionShort,
+        session: AsyncClient,
     ) -> dict[str, Any]:
-        id_ = await self._get_locality_id(locality, session)
+        id_ = await self._geocode(
+            locality,
+            session,
+            self._get_position_id
+            if isinstance(locality, PydanticPositionShort)
+            else self._get_locality_id,
+        )
         return await self._get_weather(id_, session)
 
 
@@ -95,7 +268,7 @@ class OpenWeatherMapClient(WeatherClient):
     locality_endpoint = "https://api.openweathermap.org/geo/1.0/direct"
 
     async def _get_locality_coordinates(
-        self, locality: PydanticLocality, session: AsyncClient
+        self, locality: PydanticLocalityShort, session: AsyncClient
     ) -> tuple[float, float]:
         try:
             body = (
@@ -130,34 +303,168 @@ class OpenWeatherMapClient(WeatherClient):
         )
 
     async def get(
-        self, locality: PydanticLocality, session: AsyncClient
+        self,
+        locality: PydanticLocalityShort | PydanticPositionShort,
+        session: AsyncClient,
     ) -> dict[str, Any]:
-        coordinates = await self._get_locality_coordinates(locality, session)
+        """
+        Точка уже задана координатами, поэтому геокодирование не требуется.
+        """
+        if isinstance(locality, PydanticPositionShort):
+            coordinates = locality.latitude, locality.longitude
+        else:
+            coordinates = await self._geocode(
+                locality, session, self._get_locality_coordinates
+            )
+
         return await self._get_weather(coordinates, session)
 
 
 class AggregatedWeatherClient:
-    def __init__(self, clients: tuple[WeatherClient]) -> None:
+    def __init__(
+        self,
+        clients: tuple[WeatherClient],
+        http_manager: HTTPManager,
+        cache: Cache | None = None,
+        deadline: float | None = None,
+        ttl: float | None = None,
+        stale_ttl: float | None = None,
+        stretch_from: float = 0.5,
+        max_stretch: float = 4.0,
+        skip_from: float = 0.9,
+    ) -> None:
+        """
+        По мере расходования квот наблюдения дольше считаются свежими: срок свежести растёт от ttl, когда расход самой
+        нагруженной службы достигает stretch_from, до ttl * max_stretch при исчерпании. Служба, израсходовавшая
+        skip_from квоты, опрашивается, только если остальные пропущены тоже. Наблюдение, устаревшее не более чем на
+        stale_ttl, отдаётся сразу, а обновляется в фоне.
+        """
         self.clients: tuple[WeatherClient] = clients
+        self.http_manager: HTTPManager = http_manager
+        self.cache: Cache | None = cache
+        self.deadline: float | None = deadline
+        self.ttl: float | None = ttl
+        self.stale_ttl: float | None = stale_ttl
+        self.stretch_from: float = stretch_from
+        self.max_stretch: float = max_stretch
+        self.skip_from: float = skip_from
+
+        self.hits: int = 0
+        self.misses: int = 0
+
+        self._flights: SingleFlight[PydanticObservation] = SingleFlight()
+        self._progress: dict[str, Progress[PydanticObservation]] = {}
+
+    @property
+    def breakers(self) -> dict[str, dict[str, Any]]:
+        return {
+            client.service: client.breaker.to_dict()
+            for client in self.clients
+            if client.breaker is not None
+        }
+
+    @property
+    def cache_stats(self) -> dict[str, Any]:
+        lookups = self.hits + self.misses
+
+        return {
+            "hits": self.hits,
+            "misses": self.misses,
+            "hit_rate": round(self.hits / lookups, 3) if lookups else 0.0,
+        }
 
-    @many_from_dict(PydanticWeather)
-    async def _aggregate(
-        self, locality: PydanticLocality, session: AsyncClient = AsyncClient()
-    ) -> list[dict[str, Any]]:
-        aggregation = await asyncio.gather(
-            *(client.get(locality, session) for client in self.clients)
+    @staticmethod
+    async def _request(
+        client: WeatherClient, locality: LocalityShort, session: AsyncClient
+    ) -> PydanticWeather | None:
+        try:
+            weather = await client.get(locality, session)
+        except ExternalError:
+            LOGGER.warning("%s is unavailable.", client.service)
+            return None
+
+        return PydanticWeather(service=client.service, **weather)
+
+    @property
+    def max_age(self) -> float | None:
+        if self.ttl is None:
+            return None
+
+        usage = max((client.usage for client in self.clients), default=0.0)
+
+        if usage <= self.stretch_from:
+            return self.ttl
+
+        return self.ttl * (
+            1
+            + (self.max_stretch - 1)
+            * (usage - self.stretch_from)
+            / (1 - self.stretch_from)
         )
 
-        return [
-            {"service": client.service, **weather}
-            for client, weather in zip(self.clients, aggregation)
+    @property
+    def is_saving(self) -> bool:
+        return any(client.usage > self.stretch_from for client in self.clients)
+
+    def _select(self) -> tuple[WeatherClient, ...]:
+        return tuple(
+            client for client in self.clients if client.usage < self.skip_from
+        ) or tuple(client for client in self.clients if not client.is_exhausted)
+
+    async def _stream(
+        self, locality: LocalityShort, clients: tuple[WeatherClient, ...]
+    ) -> AsyncIterator[PydanticWeather]:
+        """
+        Отдаёт ответы служб по мере поступления, пока не истечёт отведённое время. Опоздавшие и завершившиеся ошибкой
+        службы не лишают пользователя данных остальных.
+        """
+        requests = {
+            asyncio.create_task(
+                self._request(client, locality, self.http_manager.session)
+            ): client
+            for client in clients
+        }
+
+        try:
+            for request in asyncio.as_completed(requests, timeout=self.deadline):
+                weather = await request
+
+                if weather is not None:
+                    yield weather
+        except TimeoutError:
+            for request, client in requests.items():
+                if not request.done():
+                    LOGGER.warning("%s missed the deadline.", client.service)
+                    client.miss_deadline(self.deadline)
+        finally:
+            for request in requests:
+                request.cancel()
+
+    def _order(self, aggregation: list[PydanticWeather]) -> list[PydanticWeather]:
+        services = [client.service for client in self.clients]
+
+        return sorted(aggregation, key=lambda weather: services.index(weather.service))
+
+    def _compare(self, aggregation: list[PydanticWeather]) -> list[PydanticWeather]:
+        if not aggregation:
+            if all(client.is_exhausted for client in self.clients):
+                raise LimitExceededError
+
+            raise ExternalError
+
+        available = {weather.service for weather in aggregation}
+        unavailable = [
+            client.service for client in self.clients if client.service not in available
         ]
 
-    @staticmethod
-    def _compare(aggregation: list[PydanticWeather]) -> list[PydanticWeather]:
         aggregation.append(
             PydanticWeather(
-                service="Среднее на основе всех служб",
+                service=(
+                    "Среднее на основе доступных служб"
+                    if unavailable
+                    else "Среднее на основе всех служб"
+                ),
+                unavailable_services=", ".join(unavailable) or None,
                 **{
                     field: mean(getattr(weather, field) for weather in aggregation)
                     for field in PydanticWeather.to_average
@@ -167,7 +474,132 @@ class AggregatedWeatherClient:
 
         return aggregation
 
-    async def get(self, locality: Locality) -> list[PydanticWeather]:
-        aggregation = await self._aggregate(locality)
+    async def _remember(
+        self,
+        locality: LocalityShort,
+        observation: PydanticObservation,
+        clients: tuple[WeatherClient, ...],
+    ) -> None:
+        # Неполное сравнение не кэшируется, чтобы следующий запрос снова обратился к недоступным службам. Службы,
+        # пропущенные ради экономии квоты, недоступными не считаются.
+        if self.cache is not None and len(observation.weather) - 1 == len(clients):
+            await self.cache.set(locality.normalized_name, observation)
+
+    async def _fetch(self, locality: LocalityShort) -> PydanticObservation:
+        """
+        Промежуточные наблюдения публикуются для всех, кто присоединился к походу к службам через stream.
+        """
+        clients = self._select()
+        progress = self._progress.setdefault(locality.normalized_name, Progress())
+        observation = PydanticObservation(locality=locality.name, weather=[])
+        aggregation = []
+
+        try:
+            async for weather in self._stream(locality, clients):
+                aggregation.append(weather)
+                progress.publish(
+                    observation.model_copy(update={"weather": self._order(aggregation)})
+                )
+        finally:
+            del self._progress[locality.normalized_name]
+
+        observation = observation.model_copy(
+            update={"weather": self._compare(self._order(aggregation))}
+        )
+        await self._remember(locality, observation, clients)
+
+        return observation
+
+    def _revalidate(self, locality: LocalityShort) -> None:
+        self._flights.start(locality.normalized_name, partial(self._fetch, locality))
+
+    async def _recall(self, locality: LocalityShort) -> PydanticObservation | None:
+        """
+        Попадания считаются по запросам пользователей, а не по обращениям к кэшу: устаревшее наблюдение, отданное на
+        время обновления, — одно попадание, а проверки Refresher не учитываются вовсе.
+        """
+        if self.cache is None:
+            return None
+
+        observation = await self._lookup(locality)
+
+        if observation is None:
+            self.misses += 1
+        else:
+            self.hits += 1
+
+        return observation
+
+    async def _lookup(self, locality: LocalityShort) -> PydanticObservation | None:
+        max_age = self.max_age
+        observation = await self.cache.get(locality.normalized_name, max_age)
+
+        if observation is not None or max_age is None or self.stale_ttl is None:
+            return observation
+
+        observation = await self.cache.get(
+            locality.normalized_name, max_age + self.stale_ttl
+        )
+
+        if observation is not None:
+            self._revalidate(locality)
+
+        return observation
+
+    async def get(self, locality: LocalityShort) -> PydanticObservation:
+        """
+        Наблюдение кэшируется по нормализованному названию населённого пункта: текущая погода меняется медленно, а
+        запросы об одном и том же городе от разных пользователей приходят часто. Одновременные запросы об одном городе
+        объединяются в один поход к службам.
+        """
+        observation = await self._recall(locality)
+
+        if observation is not None:
+            return observation
+
+        return await self._flights.do(
+            locality.normalized_name, partial(self._fetch, locality)
+        )
 
-        return self._compare(aggregation)
+    async def stream(
+        self, locality: LocalityShort
+    ) -> AsyncIterator[PydanticObservation]:
+        """
+        Отдаёт промежуточные наблюдения по мере ответа служб, последним — полное сравнение со средним значением.
+        Поход к службам общий с одновременными запросами об этом же населённом пункте; промежуточное наблюдение,
+        вышедшее, пока получатель был занят, заменяется более новым.
+        """
+        observation = await self._recall(locality)
+
+        if observation is not None:
+            yield observation
+            return
+
+        key = locality.normalized_name
+        flight = self._flights.start(key, partial(self._fetch, locality))
+        progress = None if flight.done() else self._progress.setdefault(key, Progress())
+        shown = None
+
+        while not flight.done():
+            changed = progress.changed
+
+            if progress.latest is not None and progress.latest is not shown:
+                shown = progress.latest
+                yield shown
+                continue
+
+            await asyncio.wait((changed, flight), return_when=asyncio.FIRST_COMPLETED)
+
+        yield flight.result()
+
+    async def refresh(self, locality: LocalityShort) -> None:
+        """
+        Заранее запрашивает наблюдение, если в кэше нет свежего.
+        """
+        if (
+            self.cache is not None
+            and await self.cache.get(locality.normalized_name, self.max_age) is not None
+        ):
+            return
+
+        await self._flights.do(locality.normalized_name, partial(self._fetch, locality))
@@ -0,0 +1,80 @@
+import asyncio
+from types import TracebackType
+
+from src.model.db import DBManager, db_manager
+from src.model.repositories import AsyncpgRepository, Repository
+from src.presenter.schemas import PydanticHistoryRecord
+from src.settings import LOGGER, writer_settings
+
+
+class HistoryWriter:
+    """
+    Записывает историю в фоне: пользователю не нужно ждать записи в БД, а множество мелких транзакций заменяется
+    несколькими пакетными. Пакет сбрасывается при наборе нужного размера или по истечении интервала; при завершении
+    работы очередь дописывается полностью.
+    """
+
+    def __init__(
+        self,
+        repository: Repository,
+        db_manager: DBManager,
+        queue_size: int = 10000,
+        batch_size: int = 500,
+        flush_interval: float = 1.0,
+    ) -> None:
+        self.repository: Repository = repository
+        self.db_manager: DBManager = db_manager
+        self.batch_size: int = batch_size
+        self.flush_interval: float = flush_interval
+
+        self._queue: asyncio.Queue[PydanticHistoryRecord] = asyncio.Queue(queue_size)
+        self._task: asyncio.Task | None = None
+
+    async def put(self, record: PydanticHistoryRecord) -> None:
+        await self._queue.put(record)
+
+    async def _collect(self) -> list[PydanticHistoryRecord]:
+        batch = [await self._queue.get()]
+        deadline = asyncio.get_running_loop().time() + self.flush_interval
+
+        while len(batch) < self.batch_size:
+            try:
+                async with asyncio.timeout_at(deadline):
+                    batch.append(await self._queue.get())
+            except TimeoutError:
+                break
+
+        return batch
+
+    async def _flush(self, batch: list[PydanticHistoryRecord]) -> None:
+        try:
+            async with self.db_manager.begin() as conn:
+                await self.repository.create_records(batch, conn)
+        except Exception:
+            LOGGER.exception("Failed to write %d history records.", len(batch))
+        finally:
+            for _ in batch:
+                self._queue.task_done()
+
+    async def _run(self) -> None:
+        while True:
+            await self._flush(await self._collect())
+
+    async def __aenter__(self) -> None:
+        self._task = asyncio.create_task(self._run())
+
+    async def __aexit__(
+        self,
+        exc_type: type[BaseException] | None,
+        exc_val: BaseException | None,
+        exc_tb: TracebackType | None,
+    ) -> None:
+        await self._queue.join()
+
+        self._task.cancel()
+        self._task = None
+
+
+history_writer: HistoryWriter = HistoryWriter(
+    AsyncpgRepository(), db_manager, **writer_settings.model_dump()
+)
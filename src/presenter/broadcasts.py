@@ -0,0 +1,73 @@
+import asyncio
+from collections.abc import Awaitable, Callable
+from typing import Any
+
+from aiogram import Bot
+from aiogram.exceptions import (
+    TelegramAPIError,
+    TelegramForbiddenError,
+    TelegramRetryAfter,
+)
+
+from src.model.limiters import TokenBucket
+from src.presenter.schemas import PydanticObservation
+from src.settings import LOGGER
+from src.view.core import View
+
+
+class Broadcaster:
+    """
+    Рассылает одно и то же сообщение многим пользователям, не превышая допустимый Telegram темп массовой отправки.
+    Сообщение готовится один раз для всех получателей. Пользователь, заблокировавший бота, передаётся on_blocked.
+    """
+
+    def __init__(
+        self,
+        bot: Bot,
+        view: View,
+        pace: TokenBucket,
+        on_blocked: Callable[[int], Awaitable[None]],
+        senders: int = 8,
+    ) -> None:
+        self.bot: Bot = bot
+        self.view: View = view
+        self.pace: TokenBucket = pace
+        self.on_blocked: Callable[[int], Awaitable[None]] = on_blocked
+        self.senders: int = senders
+
+    async def _send(self, chat_id: int, messages: list[dict[str, Any]]) -> None:
+        for message in messages:
+            while True:
+                await self.pace.acquire()
+
+                try:
+                    await self.bot.send_message(chat_id, **message)
+                except TelegramRetryAfter as exc:
+                    LOGGER.warning(
+                        "Flood limit is hit, retrying in %d s.", exc.retry_after
+                    )
+                    await asyncio.sleep(exc.retry_after)
+                except TelegramForbiddenError:
+                    await self.on_blocked(chat_id)
+                    return
+                except TelegramAPIError:
+                    LOGGER.exception("Failed to send a message to %d.", chat_id)
+                    return
+                else:
+                    break
+
+    async def send_weather(
+        self, observation: PydanticObservation, chat_ids: list[int]
+    ) -> None:
+        """
+        Получатели разбираются несколькими отправителями из общей очереди: темп ограничен корзиной, а отправители
+        лишь скрывают задержку ответа Telegram.
+        """
+        messages = await self.view.render_subscription(observation)
+        queue = iter(chat_ids)
+
+        async def send() -> None:
+            for chat_id in queue:
+                await self._send(chat_id, messages)
+
+        await asyncio.gather(*(send() for _ in range(self.senders)))
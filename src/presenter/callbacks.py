@@ -0,0 +1,60 @@
+from datetime import datetime, time, timedelta
+from uuid import UUID
+
+from aiogram.filters.callback_data import CallbackData
+
+from src.presenter.schemas import PydanticHistoryCursor
+
+
+EPOCH = datetime(1970, 1, 1)
+
+
+class HistoryPageCallback(CallbackData, prefix="history"):
+    """
+    Данные кнопки ограничены 64 байтами, поэтому время записи передаётся числом микросекунд.
+    """
+
+    backward: bool
+    timestamp: int
+    id: UUID
+
+    @classmethod
+    def from_cursor(cls, cursor: PydanticHistoryCursor) -> "HistoryPageCallback":
+        return cls(
+            backward=cursor.backward,
+            timestamp=(cursor.timestamp - EPOCH) // timedelta(microseconds=1),
+            id=cursor.id,
+        )
+
+    def to_cursor(self, user_id: int) -> PydanticHistoryCursor:
+        return PydanticHistoryCursor(
+            user_id=user_id,
+            timestamp=EPOCH + timedelta(microseconds=self.timestamp),
+            id=self.id,
+            backward=self.backward,
+        )
+
+
+class LocalityCallback(CallbackData, prefix="locality"):
+    """
+    Название населённого пункта передаётся номером в справочнике: данные кнопки ограничены 64 байтами.
+    """
+
+    index: int
+
+
+class SubscriptionCallback(CallbackData, prefix="subscribe"):
+    """
+    Населённый пункт передаётся номером в справочнике, а время — числом минут с начала суток: двоеточие разделяет
+    поля данных кнопки.
+    """
+
+    index: int
+    minute: int
+
+    @classmethod
+    def from_time(cls, index: int, time_: time) -> "SubscriptionCallback":
+        return cls(index=index, minute=time_.hour * 60 + time_.minute)
+
+    def to_time(self) -> time:
+        return time(*divmod(self.minute, 60))
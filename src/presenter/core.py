@@ -1,53 +1,179 @@
-from typing import Any
-
-from aiogram import Dispatcher
-from aiogram.filters import Command, CommandStart, StateFilter
+from aiogram import Dispatcher, F
+from aiogram.filters import Command, CommandObject, CommandStart, StateFilter
 from aiogram.fsm.context import FSMContext
-from aiogram.types import Message
+from aiogram.types import CallbackQuery, Message
 from pydantic import ValidationError
 
+from src.model.breakers import CircuitBreaker
+from src.model.caches import GeocodingCache, MemoryCache
 from src.model.core import Service
+from src.model.db import db_manager
+from src.model.gazetteers import Gazetteer
+from src.model.geo import PointIndex
+from src.model.http import http_manager
+from src.model.limiters import RateLimiter
+from src.model.quotas import Quota
+from src.model.refreshers import Refresher
 from src.model.repositories import AsyncpgRepository
+from src.model.storages import DBStorage
+from src.model.subscriptions import SubscriptionRunner
 from src.model.weather_clients import (
     AccuWeatherClient,
     AggregatedWeatherClient,
     OpenWeatherMapClient,
 )
-from src.presenter.errors import AlreadyExistsError, ExternalError
-from src.presenter.middlewares import logging, transaction
+from src.model.writers import history_writer
+from src.presenter.callbacks import (
+    HistoryPageCallback,
+    LocalityCallback,
+    SubscriptionCallback,
+)
+from src.presenter.errors import (
+    AlreadyExistsError,
+    ExternalError,
+    LimitExceededError,
+    SubscriptionLimitError,
+)
+from src.presenter.middlewares import AdmissionControl, Throttling, logging
 from src.presenter.schemas import (
-    PydanticHistoryRecordShort,
+    Locality,
+    PydanticHistoryCursor,
     PydanticLocality,
+    PydanticLocalityShort,
+    PydanticPosition,
+    PydanticSubscription,
     PydanticUser,
 )
 from src.presenter.states import WeatherRequest
-from src.settings import LOGGER, api_settings
-from src.view.core import View, FormattedView
-
-
-dispatcher = Dispatcher(
-    model=Service(
-        AsyncpgRepository(),
-        AggregatedWeatherClient(
-            (
-                AccuWeatherClient(api_settings.accuweather_key.get_secret_value()),
-                OpenWeatherMapClient(
-                    api_settings.openweathermap_key.get_secret_value()
-                ),
-            )
+from src.settings import (
+    LOGGER,
+    admission_settings,
+    api_settings,
+    bot_settings,
+    breaker_settings,
+    fsm_settings,
+    gazetteer_settings,
+    http_settings,
+    quota_settings,
+    refresh_settings,
+    subscription_settings,
+    throttling_settings,
+    view_settings,
+    weather_settings,
+)
+from src.view.core import FormattedView, View
+
+repository = AsyncpgRepository()
+geocoding_cache = GeocodingCache(
+    MemoryCache(
+        weather_settings.geocoding_cache_max_size, weather_settings.geocoding_cache_ttl
+    ),
+    repository,
+    db_manager,
+    weather_settings.geocoding_cache_ttl,
+)
+quotas = {
+    service: Quota(service, limit, repository, db_manager)
+    for service, limit in (
+        ("AccuWeather", quota_settings.accuweather),
+        ("OpenWeatherMap", quota_settings.openweathermap),
+    )
+    if limit is not None
+}
+gazetteer = Gazetteer.from_file(gazetteer_settings.path)
+storage = DBStorage(
+    repository,
+    db_manager,
+    fsm_settings.ttl,
+    MemoryCache(fsm_settings.cache_max_size, fsm_settings.cache_ttl)
+    if (not bot_settings.webhook if fsm_settings.cache is None else fsm_settings.cache)
+    else None,
+)
+weather_client = AggregatedWeatherClient(
+    (
+        AccuWeatherClient(
+            api_settings.accuweather_key.get_secret_value(),
+            http_settings.max_connections_per_host,
+            geocoding_cache,
+            CircuitBreaker(
+                "AccuWeather",
+                **breaker_settings.model_dump(exclude={"report_interval"}),
+            ),
+            quotas.get("AccuWeather"),
+            positions=PointIndex(
+                weather_settings.position_radius,
+                weather_settings.position_index_size,
+            ),
+        ),
+        OpenWeatherMapClient(
+            api_settings.openweathermap_key.get_secret_value(),
+            http_settings.max_connections_per_host,
+            geocoding_cache,
+            CircuitBreaker(
+                "OpenWeatherMap",
+                **breaker_settings.model_dump(exclude={"report_interval"}),
+            ),
+            quotas.get("OpenWeatherMap"),
         ),
     ),
-    view=FormattedView(),
+    http_manager,
+    MemoryCache(weather_settings.cache_max_size, weather_settings.cache_ttl),
+    weather_settings.deadline,
+    weather_settings.cache_ttl,
+    weather_settings.stale_ttl,
+    **quota_settings.model_dump(include={"stretch_from", "max_stretch", "skip_from"}),
+)
+refresher = Refresher(
+    weather_client,
+    repository,
+    db_manager,
+    **refresh_settings.model_dump(include={"top", "window", "concurrency"}),
+)
+subscription_runner = SubscriptionRunner(
+    weather_client,
+    repository,
+    db_manager,
+    **subscription_settings.model_dump(
+        include={"utc_offset", "catch_up", "concurrency"}
+    ),
+)
+service = Service(
+    repository,
+    weather_client,
+    db_manager,
+    history_writer,
+    subscription_settings.max_per_user,
+)
+view = FormattedView(
+    view_settings.packed,
+    None
+    if view_settings.render_cache_size is None
+    else MemoryCache(view_settings.render_cache_size),
+)
+
+dispatcher = Dispatcher(storage=storage, model=service, view=view)
+
+# Нажатия кнопок расходуют тот же запас, что и сообщения: подсказка тоже ведёт к метеослужбам.
+throttling = Throttling(
+    RateLimiter(
+        throttling_settings.user_rate,
+        throttling_settings.user_capacity,
+        throttling_settings.max_users,
+    )
 )
+admission = AdmissionControl(**admission_settings.model_dump())
 
-dispatcher.update.outer_middleware(transaction)
 dispatcher.message.outer_middleware(logging)
+dispatcher.message.outer_middleware(throttling)
+dispatcher.callback_query.outer_middleware(throttling)
+dispatcher.message.outer_middleware(admission)
+dispatcher.callback_query.outer_middleware(admission)
 
 
 @dispatcher.message(StateFilter(None), CommandStart())
-async def authenticate(message: Message, model: Service, view: View, conn: Any) -> None:
+async def authenticate(message: Message, model: Service, view: View) -> None:
     try:
-        await model.register(PydanticUser(**message.from_user.model_dump()), conn)
+        await model.register(PydanticUser(**message.from_user.model_dump()))
         await view.greet_new(message)
     except AlreadyExistsError:
         await view.greet_existent(message)
@@ -67,31 +193,232 @@ async def request_locality(message: Message, view: View, state: FSMContext) -> N
     await state.set_state(WeatherRequest.locality)
 
 
+def _suggest(name: str) -> list[tuple[int, str]]:
+    return [
+        (index, gazetteer[index])
+        for index in gazetteer.suggest(name, gazetteer_settings.suggestions)
+    ]
+
+
+async def _tell_quota_exhausted(message: Message, view: View) -> None:
+    await view.tell_quota_exhausted(message)
+    LOGGER.warning("All weather service quotas are exhausted.")
+
+
+async def _show_weather(
+    message: Message, locality: Locality, model: Service, view: View
+) -> None:
+    """
+    Исчерпание квот не исправить повтором до конца суток, поэтому запрос считается завершённым.
+    """
+    try:
+        if view_settings.progressive:
+            await view.show_weather_progressively(
+                message, model.stream_weather(locality)
+            )
+        else:
+            await view.show_weather(message, await model.get_weather(locality))
+    except LimitExceededError:
+        await _tell_quota_exhausted(message, view)
+
+
+@dispatcher.message(F.location)
+async def get_weather_by_position(
+    message: Message, model: Service, view: View, state: FSMContext
+) -> None:
+    """
+    Геопозицию можно отправить и без команды /weather: её ни с чем не спутать.
+    """
+    try:
+        position = PydanticPosition(
+            user_id=message.from_user.id,
+            latitude=message.location.latitude,
+            longitude=message.location.longitude,
+            precision=weather_settings.geohash_precision,
+        )
+        await _show_weather(message, position, model, view)
+    except ExternalError as exc:
+        await view.tell_general_error(message)
+        LOGGER.exception(exc)
+    else:
+        await state.clear()
+
+
 @dispatcher.message(WeatherRequest.locality)
 async def get_weather(
-    message: Message, model: Service, view: View, conn: Any, state: FSMContext
+    message: Message, model: Service, view: View, state: FSMContext
 ) -> None:
+    """
+    Известное справочнику название приводится к принятому написанию. Неизвестное в строгом режиме отклоняется сразу,
+    иначе передаётся метеослужбам: справочник не содержит всех населённых пунктов.
+    """
+    text = message.text or ""
+    index = gazetteer.find(text)
+
+    if index is None and gazetteer_settings.strict:
+        await view.tell_unknown_locality(message, _suggest(text))
+        return
+
     try:
-        weather = await model.get_weather(
-            PydanticLocality(user_id=message.from_user.id, name=message.text), conn
+        locality = PydanticLocality(
+            user_id=message.from_user.id,
+            name=text if index is None else gazetteer[index],
         )
+        await _show_weather(message, locality, model, view)
     except ValidationError as exc:
-        await view.tell_invalid_input(message)
         LOGGER.debug("Invalid input: %s", exc.errors())
+
+        if suggestions := _suggest(text):
+            await view.tell_unknown_locality(message, suggestions)
+        else:
+            await view.tell_invalid_input(message)
     except ExternalError as exc:
-        await view.tell_general_error(message)
+        if index is None and (suggestions := _suggest(text)):
+            await view.tell_unknown_locality(message, suggestions)
+        else:
+            await view.tell_general_error(message)
+            LOGGER.exception(exc)
+    else:
+        await state.clear()
+
+
+@dispatcher.callback_query(LocalityCallback.filter())
+async def choose_locality(
+    callback: CallbackQuery,
+    callback_data: LocalityCallback,
+    model: Service,
+    view: View,
+    state: FSMContext,
+) -> None:
+    await callback.answer()
+
+    try:
+        locality = PydanticLocality(
+            user_id=callback.from_user.id, name=gazetteer[callback_data.index]
+        )
+        await _show_weather(callback.message, locality, model, view)
+    except IndexError:
+        # Справочник сменился после того, как была предложена подсказка.
+        await view.tell_invalid_input(callback.message)
+    except ExternalError as exc:
+        await view.tell_general_error(callback.message)
         LOGGER.exception(exc)
     else:
-        await view.show_weather(message, weather)
         await state.clear()
 
 
-@dispatcher.message(StateFilter(None), Command("history"))
-async def get_history(message: Message, model: Service, view: View, conn: Any) -> None:
-    history = await model.get_history(
-        PydanticHistoryRecordShort(user_id=message.from_user.id), conn
+async def _subscribe(
+    message: Message,
+    subscription: PydanticSubscription,
+    verify: bool,
+    model: Service,
+    view: View,
+) -> None:
+    try:
+        await model.subscribe(subscription, verify)
+    except SubscriptionLimitError:
+        await view.tell_subscription_limit(message, subscription_settings.max_per_user)
+    except LimitExceededError:
+        await _tell_quota_exhausted(message, view)
+    except ExternalError as exc:
+        if suggestions := _suggest(subscription.locality):
+            await view.tell_unknown_subscription_locality(
+                message, suggestions, subscription.time
+            )
+        else:
+            await view.tell_general_error(message)
+            LOGGER.exception(exc)
+    else:
+        await view.tell_subscribed(message, subscription)
+
+
+@dispatcher.message(StateFilter(None), Command("subscribe"))
+async def subscribe(
+    message: Message, command: CommandObject, model: Service, view: View
+) -> None:
+    """
+    Как и при запросе погоды, название, неизвестное справочнику, в строгом режиме отклоняется сразу, а подсказки
+    предлагают подписаться на похожие населённые пункты в то же время.
+    """
+    time_, _, name = (command.args or "").strip().partition(" ")
+    name = name.strip()
+    index = gazetteer.find(name)
+
+    try:
+        subscription = PydanticSubscription(
+            user_id=message.from_user.id,
+            locality=PydanticLocalityShort(
+                name=name if index is None else gazetteer[index]
+            ).name,
+            time=time_,
+        )
+    except ValidationError as exc:
+        await view.tell_subscription_usage(message)
+        LOGGER.debug("Invalid input: %s", exc.errors())
+        return
+
+    if index is None and gazetteer_settings.strict:
+        await view.tell_unknown_subscription_locality(
+            message, _suggest(name), subscription.time
+        )
+        return
+
+    await _subscribe(message, subscription, index is None, model, view)
+
+
+@dispatcher.callback_query(SubscriptionCallback.filter())
+async def choose_subscription(
+    callback: CallbackQuery,
+    callback_data: SubscriptionCallback,
+    model: Service,
+    view: View,
+) -> None:
+    await callback.answer()
+
+    try:
+        subscription = PydanticSubscription(
+            user_id=callback.from_user.id,
+            locality=gazetteer[callback_data.index],
+            time=callback_data.to_time(),
+        )
+    except (IndexError, ValidationError):
+        # Справочник сменился после того, как была предложена подсказка.
+        await view.tell_invalid_input(callback.message)
+        return
+
+    await _subscribe(callback.message, subscription, False, model, view)
+
+
+@dispatcher.message(StateFilter(None), Command("unsubscribe"))
+async def unsubscribe(
+    message: Message, command: CommandObject, model: Service, view: View
+) -> None:
+    """
+    Без аргумента отменяются все подписки.
+    """
+    name = (command.args or "").strip() or None
+    index = None if name is None else gazetteer.find(name)
+    count = await model.unsubscribe(
+        message.from_user.id, name if index is None else gazetteer[index]
     )
-    await view.show_history(message, history)
+    await view.tell_unsubscribed(message, count)
+
+
+@dispatcher.message(StateFilter(None), Command("history"))
+async def get_history(message: Message, model: Service, view: View) -> None:
+    page = await model.get_history(PydanticHistoryCursor(user_id=message.from_user.id))
+    await view.show_history(message, page)
+
+
+@dispatcher.callback_query(HistoryPageCallback.filter())
+async def turn_history_page(
+    callback: CallbackQuery,
+    callback_data: HistoryPageCallback,
+    model: Service,
+    view: View,
+) -> None:
+    page = await model.get_history(callback_data.to_cursor(callback.from_user.id))
+    await view.turn_history_page(callback, page)
 
 
 @dispatcher.message()
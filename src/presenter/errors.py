@@ -4,3 +4,11 @@ class AlreadyExistsError(Exception):
 
 class ExternalError(Exception):
     pass
+
+
+class LimitExceededError(ExternalError):
+    pass
+
+
+class SubscriptionLimitError(Exception):
+    pass
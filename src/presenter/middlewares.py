@@ -1,27 +1,16 @@
-import json
-from collections.abc import Awaitable, Callable
+import asyncio
+import heapq
+from collections.abc import Awaitable, Callable, Iterable, Iterator
+from itertools import count
 from typing import Any
 
-from aiogram.types import Message, Update
+from aiogram import BaseMiddleware
+from aiogram.types import CallbackQuery, Message, TelegramObject
 
-from src.model.db import db_manager
+from src.model.limiters import RateLimiter
 from src.settings import LOGGER
 
 
-async def transaction(
-    handler: Callable[[Update, dict[str, Any]], Awaitable[Any]],
-    event: Update,
-    data: dict[str, Any],
-) -> Any:
-    async with db_manager.begin() as conn:
-        await conn.set_type_codec(
-            "jsonb", encoder=json.dumps, decoder=json.loads, schema="pg_catalog"
-        )
-        data["conn"] = conn
-
-        return await handler(event, data)
-
-
 async def logging(
     handler: Callable[[Message, dict[str, Any]], Awaitable[Any]],
     event: Message,
@@ -30,3 +19,142 @@ async def logging(
     LOGGER.debug("User %d sent: %s", event.from_user.id, event.text)
 
     return await handler(event, data)
+
+
+class Throttling(BaseMiddleware):
+    """
+    Ограничивает темп сообщений и нажатий кнопок от каждого пользователя, чтобы один пользователь не расходовал квоты
+    метеослужб.
+    """
+
+    def __init__(self, limiter: RateLimiter) -> None:
+        self.limiter: RateLimiter = limiter
+
+    async def __call__(
+        self,
+        handler: Callable[[TelegramObject, dict[str, Any]], Awaitable[Any]],
+        event: TelegramObject,
+        data: dict[str, Any],
+    ) -> Any:
+        if not self.limiter.allow(event.from_user.id):
+            LOGGER.info("User %d is throttled.", event.from_user.id)
+
+            if isinstance(event, CallbackQuery):
+                await data["view"].alert_rate_limited(event)
+            else:
+                await data["view"].tell_rate_limited(event)
+
+            return None
+
+        return await handler(event, data)
+
+
+class OverloadedError(Exception):
+    pass
+
+
+class AdmissionControl(BaseMiddleware):
+    """
+    Ограничивает число одновременно обрабатываемых обновлений. Остальные ждут в ограниченной очереди, где лёгкие
+    команды обслуживаются раньше тяжёлых. Когда очередь заполнена, обновление с наименьшим приоритетом (из равных —
+    самое новое) сразу отклоняется, а пользователь получает просьбу повторить позже.
+    """
+
+    def __init__(
+        self,
+        concurrency: int,
+        queue_size: int,
+        priority_commands: Iterable[str] = ("help", "start"),
+    ) -> None:
+        self.concurrency: int = concurrency
+        self.queue_size: int = queue_size
+        self.priority_commands: frozenset[str] = frozenset(priority_commands)
+
+        self._active: int = 0
+        self._waiters: list[tuple[int, int, asyncio.Future[None]]] = []
+        self._order: Iterator[int] = count()
+
+    def _prioritize(self, event: TelegramObject) -> int:
+        if isinstance(event, Message) and event.text and event.text.startswith("/"):
+            command = event.text.split(maxsplit=1)[0][1:].split("@")[0]
+
+            if command in self.priority_commands:
+                return 0
+
+        return 1
+
+    def _enqueue(self, priority: int) -> tuple[int, int, asyncio.Future[None]]:
+        if len(self._waiters) >= self.queue_size:
+            worst = max(self._waiters)
+
+            if worst[0] <= priority:
+                raise OverloadedError
+
+            self._waiters.remove(worst)
+            heapq.heapify(self._waiters)
+            worst[2].set_exception(OverloadedError())
+
+        waiter = (
+            priority,
+            next(self._order),
+            asyncio.get_running_loop().create_future(),
+        )
+        heapq.heappush(self._waiters, waiter)
+
+        return waiter
+
+    async def _acquire(self, priority: int) -> None:
+        if self._active < self.concurrency and not self._waiters:
+            self._active += 1
+            return
+
+        waiter = self._enqueue(priority)
+        future = waiter[2]
+
+        try:
+            await future
+        except asyncio.CancelledError:
+            if not future.done():
+                self._waiters.remove(waiter)
+                heapq.heapify(self._waiters)
+            elif not future.cancelled() and future.exception() is None:
+                # Место уже передано этому обновлению.
+                self._release()
+
+            raise
+
+    def _release(self) -> None:
+        """
+        Освободившееся место передаётся ожидающему обновлению с наивысшим приоритетом без уменьшения счётчика.
+        """
+        while self._waiters:
+            _, _, future = heapq.heappop(self._waiters)
+
+            if not future.done():
+                future.set_result(None)
+                return
+
+        self._active -= 1
+
+    async def __call__(
+        self,
+        handler: Callable[[TelegramObject, dict[str, Any]], Awaitable[Any]],
+        event: TelegramObject,
+        data: dict[str, Any],
+    ) -> Any:
+        try:
+            await self._acquire(self._prioritize(event))
+        except OverloadedError:
+            LOGGER.warning("Update from user %d is shed.", event.from_user.id)
+
+            if isinstance(event, CallbackQuery):
+                await data["view"].alert_busy(event)
+            else:
+                await data["view"].tell_busy(event)
+
+            return None
+
+        try:
+            return await handler(event, data)
+        finally:
+            self._release()
@@ -4,10 +4,10 @@
 
 from abc import ABC, abstractmethod
 from collections.abc import Awaitable, Callable
-from datetime import datetime
+from datetime import datetime, time
 from functools import wraps
-from typing import Annotated, Any, ClassVar, TypeVar
-from uuid import UUID
+from typing import Annotated, Any, ClassVar, Self, TypeVar
+from uuid import UUID, uuid4
 
 from pydantic import (
     AliasChoices,
@@ -15,9 +15,13 @@ from pydantic import (
     BaseModel,
     ConfigDict,
     Field,
+    PositiveInt,
     field_validator,
+    model_validator,
 )
 
+from src.model.geo import encode, snap
+
 
 class Schema(ABC):
     @abstractmethod
@@ -72,24 +76,56 @@ class PydanticHistoryRecordShort(PydanticSchema, HistoryRecordShort):
 
 class HistoryRecord(HistoryRecordShort):
     id: Any
-    locality: Any
-    weather: Any
+    observation: Any
     timestamp: Any
 
 
 class PydanticHistoryRecord(PydanticHistoryRecordShort, HistoryRecord):
     id: UUID | None = None
-    locality: str
-    weather: list[dict[str, Any]]
+    observation: "PydanticObservation"
+    timestamp: datetime | None = None
+
+
+class HistoryCursor(HistoryRecordShort):
+    timestamp: Any
+    id: Any
+    backward: Any
+    size: Any
+
+
+class PydanticHistoryCursor(PydanticHistoryRecordShort, HistoryCursor):
+    """
+    Курсор указывает на запись, после (или, если backward, до) которой начинается страница. Пустой курсор
+    соответствует первой странице.
+    """
+
     timestamp: datetime | None = None
+    id: UUID | None = None
+    backward: bool = False
+    size: PositiveInt = 3
+
+
+class HistoryPage(Schema):
+    records: Any
+    previous: Any
+    next: Any
+
 
+class PydanticHistoryPage(PydanticSchema, HistoryPage):
+    records: list[PydanticHistoryRecord]
+    previous: PydanticHistoryCursor | None = None
+    next: PydanticHistoryCursor | None = None
 
-class Locality(Schema):
+
+def normalize_name(name: str) -> str:
+    return " ".join(name.split()).casefold().replace("ё", "е")
+
+
+class LocalityShort(Schema):
     name: Any
-    user_id: Any
 
 
-class PydanticLocality(PydanticSchema, Locality):
+class PydanticLocalityShort(PydanticSchema, LocalityShort):
     name: Annotated[
         str,
         Field(
@@ -98,7 +134,78 @@ class PydanticLocality(PydanticSchema, Locality):
             alias="locality",
         ),
     ]
+
+    @property
+    def normalized_name(self) -> str:
+        return normalize_name(self.name)
+
+
+class Locality(LocalityShort):
+    user_id: Any
+
+
+class PydanticLocality(PydanticLocalityShort, Locality):
+    user_id: int
+
+
+class PositionShort(LocalityShort):
+    latitude: Any
+    longitude: Any
+    precision: Any
+
+
+class PydanticPositionShort(PydanticSchema, PositionShort):
+    """
+    Точка привязывается к центру ячейки геохеша: пользователи поблизости разделяют одну запись кэша, а метеослужбы
+    получают одинаковые координаты. Ячейка точности 5 — около 5 × 5 км.
+    """
+
+    name: str | None = None
+    latitude: Annotated[float, Field(ge=-90, le=90)]
+    longitude: Annotated[float, Field(ge=-180, le=180)]
+    precision: Annotated[int, Field(ge=1, le=12)] = 5
+
+    @model_validator(mode="after")
+    def snap_to_cell(self) -> Self:
+        self.latitude, self.longitude = snap(
+            self.latitude, self.longitude, self.precision
+        )
+        self.name = f"Точка {self.latitude:.2f}, {self.longitude:.2f}"
+
+        return self
+
+    @property
+    def normalized_name(self) -> str:
+        return f"@{encode(self.latitude, self.longitude, self.precision)}"
+
+
+class Position(PositionShort, Locality):
+    pass
+
+
+class PydanticPosition(PydanticPositionShort, Position):
+    user_id: int
+
+
+class Subscription(Schema):
+    user_id: Any
+    locality: Any
+    time: Any
+
+
+class PydanticSubscription(PydanticSchema, Subscription):
+    """
+    Рассылка происходит с точностью до минуты.
+    """
+
     user_id: int
+    locality: str
+    time: time
+
+    @field_validator("time")
+    @classmethod
+    def truncate(cls, value: time) -> time:
+        return value.replace(second=0, microsecond=0, tzinfo=None)
 
 
 class Weather(Schema):
@@ -198,6 +305,10 @@ class PydanticWeather(PydanticSchema, Weather):
             serialization_alias="Влажность, %",
         ),
     ]
+    unavailable_services: Annotated[
+        str | None,
+        Field(min_length=1, serialization_alias="Недоступные метеослужбы"),
+    ] = None
 
     @field_validator("summary")
     @classmethod
@@ -210,6 +321,28 @@ class PydanticWeather(PydanticSchema, Weather):
         return round(value, 1)
 
 
+class Observation(Schema):
+    id: Any
+    locality: Any
+    timestamp: Any
+    weather: Any
+
+
+class PydanticObservation(PydanticSchema, Observation):
+    """
+    Результат одного обращения к метеослужбам. Разделяется всеми пользователями, получившими его из кэша, поэтому
+    в истории хранится ссылка на наблюдение, а не его копия.
+    """
+
+    id: UUID = Field(default_factory=uuid4)
+    locality: str
+    timestamp: datetime = Field(default_factory=datetime.now)
+    weather: list[PydanticWeather]
+
+
+PydanticHistoryRecord.model_rebuild()
+
+
 SchemaT = TypeVar("SchemaT", bound=Schema)
 FuncT = TypeVar("FuncT", bound=Callable[..., Awaitable[Any]])
 
@@ -0,0 +1,172 @@
+import asyncio
+import signal
+from collections.abc import Callable
+from contextlib import suppress
+from typing import Any
+
+from aiogram import Bot, Dispatcher
+from aiogram.types import Update
+from aiohttp import web
+from pydantic import ValidationError
+
+from src.settings import LOGGER
+
+
+SECRET_TOKEN_HEADER = "X-Telegram-Bot-Api-Secret-Token"
+
+
+class WebhookServer:
+    """
+    Принимает обновления от Telegram по HTTP и сразу отвечает, а обрабатывает их в фоне ограниченным числом
+    обработчиков. Очередь обновлений ограничена: при переполнении Telegram получает ошибку и повторит доставку позже.
+    Несколько экземпляров могут работать за балансировщиком нагрузки. По health_path отдаётся состояние экземпляра:
+    длина очереди и то, что сообщает health.
+    """
+
+    def __init__(
+        self,
+        dispatcher: Dispatcher,
+        bot: Bot,
+        url: str | None = None,
+        path: str = "/webhook",
+        health_path: str = "/health",
+        health: Callable[[], dict[str, Any]] | None = None,
+        host: str = "0.0.0.0",
+        port: int = 8080,
+        secret_token: str | None = None,
+        concurrency: int = 16,
+        queue_size: int = 1000,
+        shutdown_timeout: float = 30.0,
+        allowed_updates: list[str] | None = None,
+        handle_signals: bool = True,
+        close_bot_session: bool = True,
+    ) -> None:
+        self.dispatcher: Dispatcher = dispatcher
+        self.bot: Bot = bot
+        self.url: str | None = url
+        self.path: str = path
+        self.health_path: str = health_path
+        self.health: Callable[[], dict[str, Any]] | None = health
+        self.host: str = host
+        self.port: int = port
+        self.secret_token: str | None = secret_token
+        self.concurrency: int = concurrency
+        self.shutdown_timeout: float = shutdown_timeout
+        self.allowed_updates: list[str] | None = allowed_updates
+        self.handle_signals: bool = handle_signals
+        self.close_bot_session: bool = close_bot_session
+
+        self._queue: asyncio.Queue[Update] = asyncio.Queue(queue_size)
+        self._stopped: asyncio.Event = asyncio.Event()
+
+    async def _receive(self, request: web.Request) -> web.Response:
+        if (
+            self.secret_token is not None
+            and request.headers.get(SECRET_TOKEN_HEADER) != self.secret_token
+        ):
+            return web.Response(status=401)
+
+        try:
+            update = Update.model_validate(
+                await request.json(), context={"bot": self.bot}
+            )
+        except (ValueError, ValidationError):
+            return web.Response(status=400)
+
+        try:
+            self._queue.put_nowait(update)
+        except asyncio.QueueFull:
+            LOGGER.warning(
+                "Update queue is full, update %d is rejected.", update.update_id
+            )
+            return web.Response(status=503)
+
+        return web.Response()
+
+    async def _report(self, request: web.Request) -> web.Response:
+        return web.json_response(
+            {
+                "queue": self._queue.qsize(),
+                **(self.health() if self.health is not None else {}),
+            }
+        )
+
+    async def _work(self) -> None:
+        while True:
+            update = await self._queue.get()
+
+            try:
+                await self.dispatcher.feed_update(self.bot, update)
+            except Exception:
+                LOGGER.exception("Failed to process update %d.", update.update_id)
+            finally:
+                self._queue.task_done()
+
+    def _stop(self, sig: signal.Signals) -> None:
+        LOGGER.warning("Received %s signal.", sig.name)
+        self._stopped.set()
+
+    async def _drain(self) -> None:
+        try:
+            async with asyncio.timeout(self.shutdown_timeout):
+                await self._queue.join()
+        except TimeoutError:
+            LOGGER.warning("%d updates are left unprocessed.", self._queue.qsize())
+
+    async def serve(self) -> None:
+        """
+        При остановке сервер перестаёт принимать обновления, затем дожидается обработки уже принятых.
+        """
+        if self.handle_signals:
+            loop = asyncio.get_running_loop()
+
+            for sig in (signal.SIGINT, signal.SIGTERM):
+                loop.add_signal_handler(sig, self._stop, sig)
+
+        app = web.Application()
+        app.router.add_post(self.path, self._receive)
+        app.router.add_get(self.health_path, self._report)
+        runner = web.AppRunner(app, shutdown_timeout=self.shutdown_timeout)
+
+        await self.dispatcher.emit_startup(
+            bot=self.bot, dispatcher=self.dispatcher, **self.dispatcher.workflow_data
+        )
+
+        # Если адрес не задан, вебхук считается уже настроенным, например другим экземпляром.
+        if self.url is not None:
+            await self.bot.set_webhook(
+                self.url,
+                secret_token=self.secret_token,
+                allowed_updates=(
+                    self.allowed_updates or self.dispatcher.resolve_used_update_types()
+                ),
+            )
+
+        workers = [asyncio.create_task(self._work()) for _ in range(self.concurrency)]
+
+        try:
+            await runner.setup()
+            await web.TCPSite(runner, self.host, self.port).start()
+            LOGGER.info(
+                "Listening for updates on %s:%d%s.", self.host, self.port, self.path
+            )
+
+            await self._stopped.wait()
+        finally:
+            await runner.cleanup()
+            await self._drain()
+
+            for worker in workers:
+                worker.cancel()
+
+                with suppress(asyncio.CancelledError):
+                    await worker
+
+            await self.dispatcher.emit_shutdown(
+                bot=self.bot,
+                dispatcher=self.dispatcher,
+                **self.dispatcher.workflow_data,
+            )
+
+            if self.close_bot_session:
+                await self.bot.session.close()
@@ -1,7 +1,15 @@
 import logging
-from typing import Annotated, Any
+from pathlib import Path
+from typing import Annotated, Any, Literal
 
-from pydantic import AfterValidator, PositiveFloat, PositiveInt, PostgresDsn, SecretStr
+from pydantic import (
+    AfterValidator,
+    Field,
+    PositiveFloat,
+    PositiveInt,
+    PostgresDsn,
+    SecretStr,
+)
 from pydantic_settings import BaseSettings, SettingsConfigDict
 
 
@@ -28,6 +36,21 @@ class BotSettings(Settings):
     allowed_updates: list[str] | None = None
     handle_signals: bool = True
     close_bot_session: bool = True
+    webhook: bool = False
+
+
+class WebhookSettings(Settings):
+    model_config = SettingsConfigDict(env_prefix="webhook_")
+
+    url: str | None = None
+    path: str = "/webhook"
+    health_path: str = "/health"
+    host: str = "0.0.0.0"
+    port: PositiveInt = 8080
+    secret_token: SecretStr | None = None
+    concurrency: PositiveInt = 16
+    queue_size: PositiveInt = 1000
+    shutdown_timeout: PositiveFloat = 30.0
 
 
 class APISettings(Settings):
@@ -35,14 +58,162 @@ class APISettings(Settings):
     openweathermap_key: SecretStr
 
 
+class WeatherSettings(Settings):
+    cache_ttl: PositiveFloat = 300.0
+    cache_max_size: PositiveInt = 1024
+    deadline: PositiveFloat | None = None
+    geocoding_cache_ttl: PositiveFloat | None = None
+    geocoding_cache_max_size: PositiveInt = 4096
+    stale_ttl: PositiveFloat | None = 600.0
+    geohash_precision: Annotated[int, Field(ge=1, le=12)] = 5
+    position_radius: PositiveFloat = 10.0
+    position_index_size: PositiveInt = 4096
+
+
+class HTTPSettings(Settings):
+    max_connections: PositiveInt = 100
+    max_keepalive_connections: PositiveInt = 20
+    max_connections_per_host: PositiveInt = 10
+    keepalive_expiry: PositiveFloat = 30.0
+    connect_timeout: PositiveFloat = 5.0
+    read_timeout: PositiveFloat = 10.0
+    http2: bool = False
+
+
+class BreakerSettings(Settings):
+    model_config = SettingsConfigDict(env_prefix="breaker_")
+
+    window: PositiveInt = 50
+    min_calls: PositiveInt = 10
+    failure_rate: Annotated[float, Field(gt=0, le=1)] = 0.5
+    open_duration: PositiveFloat = 30.0
+    timeout_percentile: Annotated[int, Field(ge=1, le=99)] = 95
+    timeout_factor: PositiveFloat = 2.0
+    min_timeout: PositiveFloat = 1.0
+    max_timeout: PositiveFloat = 10.0
+    report_interval: PositiveFloat | None = 60.0
+
+
+class WriterSettings(Settings):
+    model_config = SettingsConfigDict(env_prefix="history_")
+
+    queue_size: PositiveInt = 10000
+    batch_size: PositiveInt = 500
+    flush_interval: PositiveFloat = 1.0
+
+
+class RetentionSettings(Settings):
+    model_config = SettingsConfigDict(env_prefix="retention_")
+
+    partitions_ahead: PositiveInt = 2
+    keep_months: PositiveInt | None = None
+    policy: Literal["detach", "drop", "archive"] = "detach"
+    archive_dir: Path = Path("archive")
+    interval: PositiveFloat = 3600.0
+
+
+class AdmissionSettings(Settings):
+    model_config = SettingsConfigDict(env_prefix="admission_")
+
+    concurrency: PositiveInt = 50
+    queue_size: PositiveInt = 200
+    priority_commands: list[str] = ["help", "start"]
+
+
+class ThrottlingSettings(Settings):
+    model_config = SettingsConfigDict(env_prefix="throttling_")
+
+    user_rate: PositiveFloat = 0.2
+    user_capacity: PositiveInt = 5
+    max_users: PositiveInt = 10000
+
+
+class QuotaSettings(Settings):
+    model_config = SettingsConfigDict(env_prefix="quota_")
+
+    accuweather: PositiveInt | None = 50
+    openweathermap: PositiveInt | None = 1000
+    sync_interval: PositiveFloat = 10.0
+    stretch_from: Annotated[float, Field(ge=0, lt=1)] = 0.5
+    max_stretch: Annotated[float, Field(ge=1)] = 4.0
+    skip_from: Annotated[float, Field(gt=0, le=1)] = 0.9
+
+
+class RefreshSettings(Settings):
+    model_config = SettingsConfigDict(env_prefix="refresh_")
+
+    enabled: bool = True
+    top: PositiveInt = 10
+    window: PositiveFloat = 604800.0
+    concurrency: PositiveInt = 4
+    interval: PositiveFloat = 240.0
+
+
+class GazetteerSettings(Settings):
+    model_config = SettingsConfigDict(env_prefix="gazetteer_")
+
+    # Населённые пункты России с населением от 500 человек из GeoNames (cities500, CC BY 4.0) с русскими названиями.
+    path: Path = Path(__file__).parent / "model" / "data" / "localities.txt"
+    strict: bool = True
+    suggestions: PositiveInt = 3
+
+
+class SubscriptionSettings(Settings):
+    model_config = SettingsConfigDict(env_prefix="subscription_")
+
+    utc_offset: Annotated[float, Field(ge=-12, le=14)] = 3.0
+    interval: PositiveFloat = 15.0
+    catch_up: PositiveInt = 5
+    concurrency: PositiveInt = 4
+    rate: PositiveFloat = 25.0
+    senders: PositiveInt = 8
+    max_per_user: PositiveInt = 5
+
+
+class FSMSettings(Settings):
+    model_config = SettingsConfigDict(env_prefix="fsm_")
+
+    ttl: PositiveFloat | None = 86400.0
+    # По умолчанию кэш включён при опросе, где все обновления получает один процесс, и выключен для вебхука.
+    cache: bool | None = None
+    cache_ttl: PositiveFloat = 60.0
+    cache_max_size: PositiveInt = 10000
+    cleanup_interval: PositiveFloat = 3600.0
+
+
+class ViewSettings(Settings):
+    progressive: bool = False
+    packed: bool = False
+    render_cache_size: PositiveInt | None = 1024
+
+
 class DBSettings(Settings):
     dsn: Annotated[PostgresDsn, AfterValidator(_to_str)]
     min_size: PositiveInt = 10
     max_size: PositiveInt = 10
     max_queries: PositiveInt = 50000
     max_inactive_connection_lifetime: PositiveFloat = 300.0
+    replica_dsns: list[Annotated[PostgresDsn, AfterValidator(_to_str)]] = []
+    replica_min_size: PositiveInt = 10
+    replica_max_size: PositiveInt = 10
+    replica_retry_interval: PositiveFloat = 30.0
+    replica_timeout: PositiveFloat = 2.0
 
 
 bot_settings = BotSettings()  # type: ignore
+webhook_settings = WebhookSettings()
 api_settings = APISettings()  # type: ignore
+weather_settings = WeatherSettings()
+http_settings = HTTPSettings()
+breaker_settings = BreakerSettings()
+writer_settings = WriterSettings()
+retention_settings = RetentionSettings()
+admission_settings = AdmissionSettings()
+throttling_settings = ThrottlingSettings()
+quota_settings = QuotaSettings()
+refresh_settings = RefreshSettings()
+gazetteer_settings = GazetteerSettings()
+subscription_settings = SubscriptionSettings()
+fsm_settings = FSMSettings()
+view_settings = ViewSettings()
 db_settings = DBSettings()  # type: ignore
@@ -1,15 +1,28 @@
 from abc import ABC, abstractmethod
-from collections.abc import Callable, Iterable, Iterator
+from collections.abc import AsyncIterator, Awaitable, Callable, Iterable, Iterator
+from datetime import time
+from functools import partial
 from typing import Any
 
-from aiogram.types import Message
+from aiogram.filters.callback_data import CallbackData
+from aiogram.types import CallbackQuery, InlineKeyboardMarkup, Message
 from aiogram.utils.formatting import Bold, Italic, Text, as_list
+from aiogram.utils.keyboard import InlineKeyboardBuilder
 
+from src.model.caches import Cache
+from src.presenter.callbacks import (
+    HistoryPageCallback,
+    LocalityCallback,
+    SubscriptionCallback,
+)
 from src.presenter.schemas import (
-    HistoryRecord,
-    PydanticHistoryRecord,
+    HistoryPage,
+    Observation,
+    PydanticHistoryPage,
+    PydanticObservation,
+    PydanticSubscription,
     PydanticWeather,
-    Weather,
+    Subscription,
 )
 
 
@@ -23,14 +36,175 @@ def answer_one(
     return wrapper
 
 
-def answer_many(
-    func: Callable[["View", Message, Any], Iterable[Text]],
-) -> Callable[["View", Message, Any], Iterable[Text]]:
+MAX_MESSAGE_LENGTH = 4096
+MAX_MESSAGE_ENTITIES = 100
+
+
+def _measure(content: Text) -> tuple[int, int]:
+    """
+    Telegram считает длину сообщения в кодовых единицах UTF-16.
+    """
+    text, entities = content.render()
+
+    return len(text.encode("utf-16-le")) // 2, len(entities)
+
+
+def _split_lines(text: str, max_length: int) -> Iterator[str]:
+    """
+    Делит строку по переводам строк, а слишком длинные строки — на куски, не разрывая суррогатные пары.
+    """
+    for line in text.splitlines(keepends=True):
+        chunk, length = "", 0
+
+        for char in line:
+            char_length = 2 if ord(char) > 0xFFFF else 1
+
+            if length + char_length > max_length:
+                yield chunk
+                chunk, length = "", 0
+
+            chunk += char
+            length += char_length
+
+        if chunk:
+            yield chunk
+
+
+def _split(node: Text, max_length: int, max_entities: int) -> list[Text]:
+    """
+    Делит узел, превышающий ограничения, по границам строк и сущностей. Сущность, не умещающаяся целиком,
+    повторяется в каждой части своего содержимого.
+    """
+    length, entities = _measure(node)
+
+    if length <= max_length and entities <= max_entities:
+        return [node]
+
+    budget = max_entities if node.type is None else max_entities - 1
+    parts = []
+
+    for child in node:
+        if isinstance(child, Text):
+            parts.extend(_split(child, max_length, budget))
+        else:
+            parts.extend(Text(line) for line in _split_lines(str(child), max_length))
+
+    pieces = pack(parts, "", max_length, budget)
+
+    if node.type is None:
+        return pieces
+
+    return [type(node)(*piece, **node._params) for piece in pieces]
+
+
+def pack(
+    portions: Iterable[Text],
+    sep: str = "\n" * 2,
+    max_length: int = MAX_MESSAGE_LENGTH,
+    max_entities: int = MAX_MESSAGE_ENTITIES,
+) -> list[Text]:
+    """
+    Жадно объединяет порции в как можно меньшее число сообщений, не нарушая ограничений Telegram на длину и число
+    сущностей. Порция, превышающая ограничения сама по себе, делится на отдельные сообщения.
+    """
+    messages = []
+    group, length, entities = [], 0, 0
+    sep_length = len(sep.encode("utf-16-le")) // 2
+
+    for portion in portions:
+        portion_length, portion_entities = _measure(portion)
+
+        if portion_length > max_length or portion_entities > max_entities:
+            if group:
+                messages.append(as_list(*group, sep=sep))
+                group, length, entities = [], 0, 0
+
+            messages.extend(_split(portion, max_length, max_entities))
+            continue
+
+        if group and (
+            length + sep_length + portion_length > max_length
+            or entities + portion_entities > max_entities
+        ):
+            messages.append(as_list(*group, sep=sep))
+            group, length, entities = [], 0, 0
+
+        length += portion_length + (sep_length if group else 0)
+        entities += portion_entities
+        group.append(portion)
+
+    if group:
+        messages.append(as_list(*group, sep=sep))
+
+    return messages
+
+
+def answer_rendered(
+    func: Callable[["View", Message, Any], Awaitable[list[dict[str, Any]]]],
+) -> Callable[["View", Message, Any], Awaitable[list[dict[str, Any]]]]:
+    """
+    Отправляет уже подготовленные сообщения: текст вместе с сущностями разметки.
+    """
+
+    async def wrapper(self, message: Message, *args: Any, **kwargs: Any) -> None:
+        for payload in await func(self, message, *args, **kwargs):
+            await message.answer(**payload)
+
+    return wrapper
+
+
+def answer_progressively(
+    func: Callable[["View", Message, Any], AsyncIterator[Text]],
+) -> Callable[["View", Message, Any], AsyncIterator[Text]]:
+    """
+    Первая порция отправляется сразу, последующие заменяют её в том же сообщении.
+    """
+
     async def wrapper(self, message: Message, *args: Any, **kwargs: Any) -> None:
-        content = func(self, message, *args, **kwargs)
+        sent = None
+
+        async for portion in func(self, message, *args, **kwargs):
+            if sent is None:
+                sent = await message.answer(**portion.as_kwargs())
+            else:
+                await sent.edit_text(**portion.as_kwargs())
+
+    return wrapper
+
+
+def answer_with_keyboard(
+    func: Callable[["View", Message, Any], tuple[Text, InlineKeyboardMarkup | None]],
+) -> Callable[["View", Message, Any], tuple[Text, InlineKeyboardMarkup | None]]:
+    async def wrapper(self, message: Message, *args: Any, **kwargs: Any) -> None:
+        content, keyboard = func(self, message, *args, **kwargs)
+        await message.answer(**content.as_kwargs(), reply_markup=keyboard)
+
+    return wrapper
+
 
-        for portion in content:
-            await message.answer(**portion.as_kwargs())
+def edit_with_keyboard(
+    func: Callable[
+        ["View", CallbackQuery, Any], tuple[Text, InlineKeyboardMarkup | None]
+    ],
+) -> Callable[["View", CallbackQuery, Any], tuple[Text, InlineKeyboardMarkup | None]]:
+    async def wrapper(self, callback: CallbackQuery, *args: Any, **kwargs: Any) -> None:
+        content, keyboard = func(self, callback, *args, **kwargs)
+        await callback.message.edit_text(**content.as_kwargs(), reply_markup=keyboard)
+        await callback.answer()
+
+    return wrapper
+
+
+def answer_alert(
+    func: Callable[["View", CallbackQuery, Any], Text],
+) -> Callable[["View", CallbackQuery, Any], Text]:
+    """
+    Уведомление о нажатии кнопки не поддерживает форматирование, поэтому передаётся только текст.
+    """
+
+    async def wrapper(self, callback: CallbackQuery, *args: Any, **kwargs: Any) -> None:
+        content = func(self, callback, *args, **kwargs)
+        await callback.answer(content.render()[0], show_alert=True)
 
     return wrapper
 
@@ -53,11 +227,55 @@ class View(ABC):
         pass
 
     @abstractmethod
-    def show_weather(self, message: Message, weather: list[Weather]) -> Any:
+    def show_weather(self, message: Message, observation: Observation) -> Any:
+        pass
+
+    @abstractmethod
+    def show_weather_progressively(
+        self, message: Message, observations: AsyncIterator[Observation]
+    ) -> Any:
+        pass
+
+    @abstractmethod
+    async def render_subscription(
+        self, observation: Observation
+    ) -> list[dict[str, Any]]:
+        pass
+
+    @abstractmethod
+    def tell_subscribed(self, message: Message, subscription: Subscription) -> Any:
+        pass
+
+    @abstractmethod
+    def tell_unsubscribed(self, message: Message, count: int) -> Any:
+        pass
+
+    @abstractmethod
+    def tell_subscription_usage(self, message: Message) -> Any:
         pass
 
     @abstractmethod
-    def show_history(self, message: Message, history: list[HistoryRecord]) -> Any:
+    def tell_subscription_limit(self, message: Message, limit: int) -> Any:
+        pass
+
+    @abstractmethod
+    def show_history(self, message: Message, page: HistoryPage) -> Any:
+        pass
+
+    @abstractmethod
+    def turn_history_page(self, callback: CallbackQuery, page: HistoryPage) -> Any:
+        pass
+
+    @abstractmethod
+    def tell_unknown_locality(
+        self, message: Message, suggestions: list[tuple[int, str]]
+    ) -> Any:
+        pass
+
+    @abstractmethod
+    def tell_unknown_subscription_locality(
+        self, message: Message, suggestions: list[tuple[int, str]], time_: time
+    ) -> Any:
         pass
 
     @abstractmethod
@@ -72,8 +290,37 @@ class View(ABC):
     def tell_unknown(self, message: Message) -> Any:
         pass
 
+    @abstractmethod
+    def tell_busy(self, message: Message) -> Any:
+        pass
+
+    @abstractmethod
+    def tell_rate_limited(self, message: Message) -> Any:
+        pass
+
+    @abstractmethod
+    def tell_quota_exhausted(self, message: Message) -> Any:
+        pass
+
+    @abstractmethod
+    def alert_busy(self, callback: CallbackQuery) -> Any:
+        pass
+
+    @abstractmethod
+    def alert_rate_limited(self, callback: CallbackQuery) -> Any:
+        pass
+
 
 class FormattedView(View):
+    def __init__(self, packed: bool = False, render_cache: Cache | None = None) -> None:
+        """
+        В упакованном режиме порции ответа объединяются в минимальное число сообщений, что экономит обращения к API.
+        Готовые сообщения о погоде разделяются всеми пользователями и кэшируются по идентификатору наблюдения: при
+        обновлении наблюдения он меняется, поэтому устаревшие сообщения не выдаются, а со временем вытесняются.
+        """
+        self.packed: bool = packed
+        self.render_cache: Cache | None = render_cache
+
     @staticmethod
     def _greet(message: Message, additional: tuple[str | Text]) -> Text:
         return Text("Привет, ", Bold(message.from_user.first_name), "! ", *additional)
@@ -106,9 +353,19 @@ class FormattedView(View):
                         "☀️",
                         "/weather",
                         "Определить текущее состояние погоды на основе сопоставления данных от нескольких "
-                        "метеослужб",
+                        "метеослужб (можно также просто отправить геопозицию)",
                     ),
                     ("📃", "/history", "Вывести историю погодных запросов"),
+                    (
+                        "🔔",
+                        "/subscribe ЧЧ:ММ Город",
+                        "Ежедневно присылать погоду в населённом пункте в заданное время",
+                    ),
+                    (
+                        "🔕",
+                        "/unsubscribe [Город]",
+                        "Отменить подписку на населённый пункт или все подписки",
+                    ),
                 )
             ],
         )
@@ -118,48 +375,216 @@ class FormattedView(View):
         return Text(
             "Введи ",
             Bold("название населённого пункта России"),
-            ", погоду в котором хочешь узнать.",
+            ", погоду в котором хочешь узнать, или отправь геопозицию.",
         )
 
     @staticmethod
     def _render_list(pairs: dict[str, Any]) -> Text:
         return as_list(*(f"{param}: {value}" for param, value in pairs.items()))
 
-    @answer_many
-    def show_weather(
-        self, message: Message, comparison: list[PydanticWeather]
-    ) -> Iterator[Text]:
-        return (
-            self._render_list(weather.to_dict(by_alias=True, exclude_none=True))
-            for weather in comparison
+    def _render_weather(self, weather: PydanticWeather) -> Text:
+        return self._render_list(weather.to_dict(by_alias=True, exclude_none=True))
+
+    async def _render_cached(
+        self, key: str, render: Callable[[], Iterable[Text]]
+    ) -> list[dict[str, Any]]:
+        if self.render_cache is not None:
+            payloads = await self.render_cache.get(key)
+
+            if payloads is not None:
+                return payloads
+
+        payloads = [content.as_kwargs() for content in render()]
+
+        if self.render_cache is not None:
+            await self.render_cache.set(key, payloads)
+
+        return payloads
+
+    def _render_observation(self, observation: PydanticObservation) -> list[Text]:
+        portions = [self._render_weather(weather) for weather in observation.weather]
+
+        return pack(portions) if self.packed else portions
+
+    @answer_rendered
+    async def show_weather(
+        self, message: Message, observation: PydanticObservation
+    ) -> list[dict[str, Any]]:
+        return await self._render_cached(
+            str(observation.id), partial(self._render_observation, observation)
         )
 
-    @answer_many
-    def show_history(
-        self, message: Message, history: list[PydanticHistoryRecord]
-    ) -> Iterator[Text]:
-        if not history:
-            return iter(
-                (
-                    Text(
-                        "Ты ещё не сравнивал погоду. Самое время это исправить — введи ",
-                        Italic("/weather"),
-                        "!",
+    # Промежуточные наблюдения разделяют идентификатор с итоговым, поэтому не кэшируются.
+    @answer_progressively
+    async def show_weather_progressively(
+        self, message: Message, observations: AsyncIterator[PydanticObservation]
+    ) -> AsyncIterator[Text]:
+        async for observation in observations:
+            yield as_list(
+                *(self._render_weather(weather) for weather in observation.weather),
+                sep="\n" * 2,
+            )
+
+    def _render_subscription(self, observation: PydanticObservation) -> list[Text]:
+        return pack(
+            (
+                Text("🔔 Погода по подписке: ", Bold(observation.locality)),
+                *(self._render_weather(weather) for weather in observation.weather),
+            )
+        )
+
+    async def render_subscription(
+        self, observation: PydanticObservation
+    ) -> list[dict[str, Any]]:
+        """
+        Рассылка всегда упаковывается: сообщение уходит многим получателям, и каждое лишнее тратит лимит отправки.
+        """
+        return await self._render_cached(
+            f"{observation.id}:subscription",
+            partial(self._render_subscription, observation),
+        )
+
+    @answer_one
+    def tell_subscribed(
+        self, message: Message, subscription: PydanticSubscription
+    ) -> Text:
+        return Text(
+            "Готово! Буду присылать погоду в населённом пункте ",
+            Bold(subscription.locality),
+            " каждый день в ",
+            Bold(subscription.time.strftime("%H:%M")),
+            ".",
+        )
+
+    @answer_one
+    def tell_unsubscribed(self, message: Message, count: int) -> Text:
+        if not count:
+            return Text("Таких подписок у тебя нет.")
+
+        return Text("Готово! Подписка отменена.")
+
+    @answer_one
+    def tell_subscription_usage(self, message: Message) -> Text:
+        return Text(
+            "Чтобы подписаться, введи команду, время и название населённого пункта, например: ",
+            Italic("/subscribe 07:30 Москва"),
+            ".",
+        )
+
+    @answer_one
+    def tell_subscription_limit(self, message: Message, limit: int) -> Text:
+        return Text(
+            "Подписок может быть не больше ",
+            Bold(limit),
+            ". Отмени ненужную командой ",
+            Italic("/unsubscribe Город"),
+            " и попробуй снова.",
+        )
+
+    def _render_history_page(
+        self, page: PydanticHistoryPage
+    ) -> tuple[Text, InlineKeyboardMarkup | None]:
+        if not page.records:
+            return (
+                Text(
+                    "Ты ещё не сравнивал погоду. Самое время это исправить — введи ",
+                    Italic("/weather"),
+                    "!",
+                ),
+                None,
+            )
+
+        content = as_list(
+            *(
+                Text(
+                    Bold(record.observation.locality),
+                    ", ",
+                    Italic(record.timestamp.strftime("%d.%m.%Y %H:%M")),
+                    "\n",
+                    as_list(
+                        *(
+                            self._render_weather(weather)
+                            for weather in record.observation.weather
+                        ),
+                        sep="\n" * 2,
                     ),
                 )
+                for record in page.records
+            ),
+            sep="\n" * 2,
+        )
+
+        if page.previous is None and page.next is None:
+            return content, None
+
+        keyboard = InlineKeyboardBuilder()
+
+        if page.previous is not None:
+            keyboard.button(
+                text="⬅️ Новее",
+                callback_data=HistoryPageCallback.from_cursor(page.previous),
             )
-        return (
-            Text(
-                Bold(record.locality),
-                ", ",
-                Italic(record.timestamp.strftime("%d.%m.%Y %H:%M")),
-                "\n",
-                as_list(
-                    *(self._render_list(weather) for weather in record.weather),
-                    sep="\n" * 2,
+        if page.next is not None:
+            keyboard.button(
+                text="Старее ➡️",
+                callback_data=HistoryPageCallback.from_cursor(page.next),
+            )
+
+        return content, keyboard.as_markup()
+
+    @answer_with_keyboard
+    def show_history(
+        self, message: Message, page: PydanticHistoryPage
+    ) -> tuple[Text, InlineKeyboardMarkup | None]:
+        return self._render_history_page(page)
+
+    @edit_with_keyboard
+    def turn_history_page(
+        self, callback: CallbackQuery, page: PydanticHistoryPage
+    ) -> tuple[Text, InlineKeyboardMarkup | None]:
+        return self._render_history_page(page)
+
+    @staticmethod
+    def _render_suggestions(
+        suggestions: list[tuple[int, str]], callback: Callable[[int], CallbackData]
+    ) -> tuple[Text, InlineKeyboardMarkup | None]:
+        if not suggestions:
+            return (
+                Text(
+                    "Я не знаю такого населённого пункта. Проверь название и попробуй ещё раз."
                 ),
+                None,
             )
-            for record in history
+
+        keyboard = InlineKeyboardBuilder()
+
+        for index, name in suggestions:
+            keyboard.button(text=name, callback_data=callback(index))
+
+        keyboard.adjust(1)
+
+        return (
+            Text("Я не знаю такого населённого пункта. Возможно, ты имел в виду:"),
+            keyboard.as_markup(),
+        )
+
+    @answer_with_keyboard
+    def tell_unknown_locality(
+        self, message: Message, suggestions: list[tuple[int, str]]
+    ) -> tuple[Text, InlineKeyboardMarkup | None]:
+        return self._render_suggestions(
+            suggestions, lambda index: LocalityCallback(index=index)
+        )
+
+    @answer_with_keyboard
+    def tell_unknown_subscription_locality(
+        self, message: Message, suggestions: list[tuple[int, str]], time_: time
+    ) -> tuple[Text, InlineKeyboardMarkup | None]:
+        """
+        Кнопка подсказки сразу оформляет подписку на выбранный населённый пункт в указанное время.
+        """
+        return self._render_suggestions(
+            suggestions, lambda index: SubscriptionCallback.from_time(index, time_)
         )
 
     @answer_one
@@ -181,3 +606,35 @@ class FormattedView(View):
             Italic("/help"),
             ".",
         )
+
+    @staticmethod
+    def _render_busy() -> Text:
+        return Text(
+            "Сейчас у меня слишком много запросов. Пожалуйста, попробуй через минуту."
+        )
+
+    @answer_one
+    def tell_busy(self, message: Message) -> Text:
+        return self._render_busy()
+
+    @answer_alert
+    def alert_busy(self, callback: CallbackQuery) -> Text:
+        return self._render_busy()
+
+    @answer_one
+    def tell_rate_limited(self, message: Message) -> Text:
+        return Text(
+            "Ты отправляешь сообщения слишком часто. Пожалуйста, подожди немного и попробуй снова."
+        )
+
+    @answer_alert
+    def alert_rate_limited(self, callback: CallbackQuery) -> Text:
+        return Text(
+            "Ты нажимаешь кнопки слишком часто. Пожалуйста, подожди немного и попробуй снова."
+        )
+
+    @answer_one
+    def tell_quota_exhausted(self, message: Message) -> Text:
+        return Text(
+            "Лимит обращений к метеослужбам на сегодня исчерпан. Пожалуйста, попробуй позже."
+        )
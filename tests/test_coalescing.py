@@ -0,0 +1,143 @@
+import asyncio
+
+import pytest
+
+from src.model.coalescing import SingleFlight
+
+
+class Fetch:
+    def __init__(
+        self, result: object = "result", error: Exception | None = None
+    ) -> None:
+        self.result = result
+        self.error = error
+        self.calls = 0
+        self.cancelled = False
+        self.release = asyncio.Event()
+
+    async def __call__(self) -> object:
+        self.calls += 1
+
+        try:
+            await self.release.wait()
+        except asyncio.CancelledError:
+            self.cancelled = True
+            raise
+
+        if self.error is not None:
+            raise self.error
+
+        return self.result
+
+
+def test_concurrent_calls_with_same_key_are_deduplicated() -> None:
+    async def main() -> None:
+        flights = SingleFlight()
+        fetch = Fetch()
+        waiters = [asyncio.create_task(flights.do("key", fetch)) for _ in range(5)]
+        await asyncio.sleep(0)
+
+        assert "key" in flights
+        assert len(flights) == 1
+
+        fetch.release.set()
+
+        assert await asyncio.gather(*waiters) == ["result"] * 5
+        assert fetch.calls == 1
+
+    asyncio.run(main())
+
+
+def test_calls_with_different_keys_are_not_deduplicated() -> None:
+    async def main() -> None:
+        flights = SingleFlight()
+        first, second = Fetch("first"), Fetch("second")
+        waiters = [
+            asyncio.create_task(flights.do("first", first)),
+            asyncio.create_task(flights.do("second", second)),
+        ]
+        await asyncio.sleep(0)
+        first.release.set()
+        second.release.set()
+
+        assert await asyncio.gather(*waiters) == ["first", "second"]
+        assert (first.calls, second.calls) == (1, 1)
+
+    asyncio.run(main())
+
+
+def test_finished_flight_is_forgotten() -> None:
+    async def main() -> None:
+        flights = SingleFlight()
+        fetch = Fetch()
+        fetch.release.set()
+
+        await flights.do("key", fetch)
+        await asyncio.sleep(0)
+
+        assert "key" not in flights
+
+        await flights.do("key", fetch)
+
+        assert fetch.calls == 2
+
+    asyncio.run(main())
+
+
+def test_error_reaches_every_waiter() -> None:
+    async def main() -> None:
+        flights = SingleFlight()
+        error = ValueError("unavailable")
+        fetch = Fetch(error=error)
+        waiters = [asyncio.create_task(flights.do("key", fetch)) for _ in range(3)]
+        await asyncio.sleep(0)
+        fetch.release.set()
+
+        results = await asyncio.gather(*waiters, return_exceptions=True)
+
+        assert results == [error] * 3
+        assert fetch.calls == 1
+        await asyncio.sleep(0)
+        assert "key" not in flights
+
+    asyncio.run(main())
+
+
+def test_waiter_cancellation_does_not_cancel_shared_call() -> None:
+    async def main() -> None:
+        flights = SingleFlight()
+        fetch = Fetch()
+        cancelled = asyncio.create_task(flights.do("key", fetch))
+        waiting = asyncio.create_task(flights.do("key", fetch))
+        await asyncio.sleep(0)
+
+        cancelled.cancel()
+
+        with pytest.raises(asyncio.CancelledError):
+            await cancelled
+
+        fetch.release.set()
+
+        assert await waiting == "result"
+        assert not fetch.cancelled
+        assert fetch.calls == 1
+
+    asyncio.run(main())
+
+
+def test_shared_call_completes_after_all_waiters_are_cancelled() -> None:
+    async def main() -> None:
+        flights = SingleFlight()
+        fetch = Fetch()
+        waiter = asyncio.create_task(flights.do("key", fetch))
+        await asyncio.sleep(0)
+        flight = flights.start("key", fetch)
+
+        waiter.cancel()
+        await asyncio.gather(waiter, return_exceptions=True)
+        fetch.release.set()
+
+        assert await flight == "result"
+        assert not fetch.cancelled
+
+    asyncio.run(main())
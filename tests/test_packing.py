@@ -0,0 +1,83 @@
+from aiogram.utils.formatting import Bold, Text
+
+from src.view.core import MAX_MESSAGE_ENTITIES, MAX_MESSAGE_LENGTH, _measure, pack
+
+
+SEP_LENGTH = 2
+
+
+def test_empty_input_gives_no_messages() -> None:
+    assert pack([]) == []
+
+
+def test_portions_filling_message_exactly_are_packed_together() -> None:
+    half = (MAX_MESSAGE_LENGTH - SEP_LENGTH) // 2
+    messages = pack([Text("a" * half), Text("b" * half)])
+
+    assert len(messages) == 1
+    assert _measure(messages[0]) == (MAX_MESSAGE_LENGTH, 0)
+
+
+def test_portions_one_unit_over_are_split() -> None:
+    half = (MAX_MESSAGE_LENGTH - SEP_LENGTH) // 2
+    messages = pack([Text("a" * (half + 1)), Text("b" * half)])
+
+    assert [_measure(message)[0] for message in messages] == [half + 1, half]
+
+
+def test_length_is_measured_in_utf16_code_units() -> None:
+    # Эмодзи вне базовой плоскости занимает две кодовые единицы UTF-16, хотя len() считает его одним символом.
+    emoji = "\N{GRINNING FACE}"
+    fitting = pack([Text(emoji * 1023), Text(emoji * 1024)])
+    overflowing = pack([Text(emoji * 1024), Text(emoji * 1024)])
+
+    assert len(fitting) == 1
+    assert _measure(fitting[0])[0] == MAX_MESSAGE_LENGTH
+    assert len(overflowing) == 2
+
+
+def test_entities_are_capped() -> None:
+    fitting = pack([Bold("x") for _ in range(MAX_MESSAGE_ENTITIES)])
+    overflowing = pack([Bold("x") for _ in range(MAX_MESSAGE_ENTITIES + 1)])
+
+    assert len(fitting) == 1
+    assert _measure(fitting[0])[1] == MAX_MESSAGE_ENTITIES
+    assert [_measure(message)[1] for message in overflowing] == [
+        MAX_MESSAGE_ENTITIES,
+        1,
+    ]
+
+
+def test_oversized_portions_are_split_within_limits() -> None:
+    long = Text(*(f"line {index}\n" for index in range(1000)), "a" * MAX_MESSAGE_LENGTH)
+    crowded = Text(*(Bold("x") for _ in range(MAX_MESSAGE_ENTITIES * 2 + 1)))
+    messages = pack([Text("before"), long, crowded, Text("after")])
+
+    for message in messages:
+        length, entities = _measure(message)
+
+        assert length <= MAX_MESSAGE_LENGTH
+        assert entities <= MAX_MESSAGE_ENTITIES
+
+    assert messages[0].render()[0] == "before"
+    assert messages[-1].render()[0] == "after"
+    assert "".join(message.render()[0] for message in messages[1:-1]) == (
+        long.render()[0] + crowded.render()[0]
+    )
+
+
+def test_oversized_portion_is_split_at_line_boundaries() -> None:
+    lines = [f"{index:04}\n" for index in range(1000)]
+    messages = pack([Text(*lines)])
+
+    assert len(messages) > 1
+    assert all(message.render()[0].endswith("\n") for message in messages)
+
+
+def test_order_of_portions_is_preserved() -> None:
+    portions = [Text(str(index) * 1000) for index in range(10)]
+    text = "".join(message.render()[0] for message in pack(portions))
+
+    assert text.replace("\n", "") == "".join(
+        portion.render()[0] for portion in portions
+    )